@@ -2,10 +2,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
 import yaml
 
+import call_state
+from call_stats import bucket_ceil, get_stats, recompute_call_day, to_utc
 from database import get_db
 import models
 from schemas import CallListResponse, CallResponse, CallUpdate
@@ -67,6 +70,8 @@ def update_call(call_id: int, call_update: CallUpdate, db: Session = Depends(get
     if call_update.user_intent is not None:
         call.user_intent = call_update.user_intent
     
+    # Recalcular las estadísticas del día de la llamada en la misma transacción
+    recompute_call_day(db, call.start_time)
     db.commit()
     db.refresh(call)
     
@@ -81,17 +86,65 @@ def delete_call(call_id: int, db: Session = Depends(get_db)):
     if not call:
         raise HTTPException(status_code=404, detail=f"Llamada con id {call_id} no encontrada")
     
+    start_time = call.start_time
     db.delete(call)
+    recompute_call_day(db, start_time)
     db.commit()
     
     return {"message": f"Llamada {call_id} eliminada exitosamente"}
 
 
+@router.get("/live-calls")
+def get_live_calls():
+    """Llamadas en curso en todos los workers que comparten el call-state store"""
+    if call_state.store is None:
+        raise HTTPException(status_code=503, detail="Call state store no configurado")
+    calls = [
+        {
+            "call_sid": snapshot.call_sid,
+            "stream_sid": snapshot.stream_sid,
+            "worker_id": snapshot.worker_id,
+            "user_phone": snapshot.user_phone,
+            "session_profile": snapshot.session_profile,
+            "started_at": snapshot.started_at,
+            "updated_at": snapshot.updated_at,
+            "interactions": len(snapshot.conversation),
+        }
+        for snapshot in call_state.store.list_active()
+    ]
+    return {"calls": calls, "total": len(calls)}
+
+
+@router.get("/stats")
+def get_call_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    """Estadísticas agregadas de llamadas (por defecto, desde el inicio del día UTC de end)
+
+    Se leen solo las tablas de rollups; el rango se redondea a horas completas.
+    """
+    # Fechas sin zona horaria se interpretan como UTC
+    end = to_utc(end) if end is not None else datetime.now(timezone.utc)
+    if start is None:
+        # El día UTC que contiene end (el anterior si end cae justo a medianoche)
+        start = bucket_ceil(end, "day") - timedelta(days=1)
+    else:
+        start = to_utc(start)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start debe ser anterior a end")
+    return get_stats(db, start, end)
+
+
 @router.get("/openapi.yaml", tags=["Documentacion"])
 def get_openapi_yaml(request: Request):
     """Descargar OpenAPI en formato YAML"""
-    openapi_dict = request.app.openapi()
-    yaml_str = yaml.safe_dump(openapi_dict, sort_keys=False, allow_unicode=True)
+    # El esquema no cambia en tiempo de ejecución: se genera y serializa una sola vez
+    yaml_str = getattr(request.app.state, "openapi_yaml", None)
+    if yaml_str is None:
+        openapi_dict = request.app.openapi()
+        yaml_str = yaml.safe_dump(openapi_dict, sort_keys=False, allow_unicode=True)
+        request.app.state.openapi_yaml = yaml_str
     headers = {"Content-Disposition": 'attachment; filename="openapi.yaml"'}
     return Response(content=yaml_str, media_type="application/x-yaml", headers=headers)
-
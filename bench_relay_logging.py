@@ -0,0 +1,157 @@
+"""Benchmark logging overhead on the audio relay hot path.
+
+Replays a synthetic stream of OpenAI Realtime events (mostly audio deltas,
+plus transcripts, ``response.done`` and ``rate_limits.updated`` bodies)
+inside a running asyncio loop, paced like a live call, and compares the old
+``print()`` calls with ``structured_logging``. Log output goes to a sink
+whose writes block for ``--write-delay-ms`` (a slow pipe or log collector;
+0 behaves like ``/dev/null``). For each mode it reports:
+
+- the on-loop cost of each logging call (what the relay coroutine pays);
+- event loop lag, measured by a ticker task that wakes every millisecond,
+  which also captures stalls caused by the writer thread holding the GIL.
+
+Usage:
+
+    python bench_relay_logging.py --calls 20 --write-delay-ms 1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import statistics
+import sys
+import time
+
+import structured_logging
+from main import LOG_EVENT_TYPES
+
+AUDIO_DELTA = {"type": "response.audio.delta", "delta": "A" * 800}
+RESPONSE_DONE = {
+    "type": "response.done",
+    "response": {
+        "output": [
+            {
+                "role": "assistant",
+                "content": [{"type": "audio", "transcript": "Claro, con gusto te explico. " * 20}],
+            }
+        ],
+        "usage": {"total_tokens": 1234, "input_token_details": {"cached_tokens": 0}},
+    },
+}
+RATE_LIMITS = {
+    "type": "rate_limits.updated",
+    "rate_limits": [{"name": "tokens", "limit": 40000, "remaining": 39000, "reset_seconds": 1.5}] * 4,
+}
+TRANSCRIPT = {
+    "type": "conversation.item.input_audio_transcription.completed",
+    "transcript": "Hola, quisiera saber el precio del producto",
+}
+SPEECH_STARTED = {"type": "input_audio_buffer.speech_started"}
+
+
+def call_events():
+    """Events for one simulated call: 10 turns of ~50 audio deltas each."""
+    events = []
+    for _ in range(10):
+        events.append(SPEECH_STARTED)
+        events.append(TRANSCRIPT)
+        events.extend([AUDIO_DELTA] * 50)
+        events.append(RESPONSE_DONE)
+        events.append(RATE_LIMITS)
+    return events
+
+
+def log_with_print(response):
+    if response["type"] in LOG_EVENT_TYPES:
+        print(f"Received event: {response['type']}", response)
+    if response["type"] == TRANSCRIPT["type"]:
+        print(f"📝 User said: {response['transcript']}")
+
+
+def log_structured(response):
+    if response["type"] in LOG_EVENT_TYPES:
+        structured_logging.log_event(response["type"], response)
+    if response["type"] == TRANSCRIPT["type"]:
+        structured_logging.log(logging.INFO, "User said", transcript=response["transcript"])
+
+
+class SlowSink:
+    """File-like object whose writes block, like a full pipe or slow collector."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+async def measure(log_fn, events, interval: float):
+    """Replay ``events`` one every ``interval`` seconds; return (log costs, loop lags)."""
+    costs, lags = [], []
+    done = False
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done:
+            expected = loop.time() + 0.001
+            await asyncio.sleep(0.001)
+            lags.append(max(loop.time() - expected, 0.0))
+
+    ticker_task = asyncio.create_task(ticker())
+    for response in events:
+        start = time.perf_counter()
+        log_fn(response)
+        costs.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    done = True
+    await ticker_task
+    return costs, lags
+
+
+def _summary(samples) -> str:
+    samples_us = sorted(s * 1e6 for s in samples)
+    p99 = samples_us[max(int(len(samples_us) * 0.99) - 1, 0)]
+    return f"mean {statistics.mean(samples_us):8.1f}  p99 {p99:8.1f}  max {samples_us[-1]:9.1f}"
+
+
+def report(name, costs, lags):
+    print(f"{name:<26} log call µs: {_summary(costs)}", file=sys.stderr)
+    print(f"{'':<26} loop lag µs: {_summary(lags)}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--write-delay-ms", type=float, default=1.0, help="Blocking time per sink write")
+    parser.add_argument("--event-interval-ms", type=float, default=1.0, help="Time between relay events")
+    args = parser.parse_args()
+
+    # Cuerpos deserializados como en el relay real (json.loads por mensaje)
+    events = [json.loads(json.dumps(e)) for e in call_events()] * args.calls
+    sink = SlowSink(args.write_delay_ms / 1000)
+    interval = args.event_interval_ms / 1000
+    print(
+        f"{len(events)} events ({args.calls} simulated calls), "
+        f"sink write delay {args.write_delay_ms} ms, event interval {args.event_interval_ms} ms",
+        file=sys.stderr,
+    )
+
+    with contextlib.redirect_stdout(sink):
+        report("print()", *asyncio.run(measure(log_with_print, events, interval)))
+
+    structured_logging.configure_logging(stream=sink)
+    report("structured (INFO)", *asyncio.run(measure(log_structured, events, interval)))
+    structured_logging.logger.setLevel(logging.DEBUG)
+    report("structured (DEBUG, all)", *asyncio.run(measure(log_structured, events, interval)))
+    structured_logging.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
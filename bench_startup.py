@@ -0,0 +1,75 @@
+"""Benchmark worker cold start: import time and time to first `/` response.
+
+Each run happens in a fresh interpreter so module caches don't hide import
+cost. Usage:
+
+    python bench_startup.py --runs 5 --max-ms 500
+
+Exits with status 1 if the median time to first response exceeds --max-ms.
+The same probe runs in the test suite (tests/test_startup.py). Requires
+httpx (see requirements-dev.txt).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, Optional
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.create_app()) as client:
+    response = client.get("/")
+    t2 = time.perf_counter()
+assert response.status_code == 200, response.text
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "first_response_ms": (t2 - t0) * 1000,
+    "twilio_rest_loaded": "twilio.rest" in sys.modules,
+}))
+"""
+
+
+def run_once(env_overrides: Optional[Dict[str, str]] = None) -> dict:
+    """Start a fresh interpreter, serve one ``/`` request and return its timings."""
+    env = dict(os.environ)
+    # Credenciales ficticias: el benchmark no llama a Twilio ni a OpenAI
+    for name in ("OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER"):
+        env.setdefault(name, "bench")
+    env.update(env_overrides or {})
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.realpath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    import_ms = statistics.median(s["import_ms"] for s in samples)
+    first_response_ms = statistics.median(s["first_response_ms"] for s in samples)
+
+    print(f"import main:          {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"first / response:     {first_response_ms:8.1f} ms (median of {args.runs})")
+
+    if args.max_ms is not None and first_response_ms > args.max_ms:
+        print(f"❌ Cold start exceeds budget of {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Shared live-call state.
+
+Each media stream keeps its state (conversation buffer, SIDs, start time) in
+coroutine locals. To make that state visible outside the worker handling the
+call, the relay periodically checkpoints a ``CallSnapshot`` into a
+``CallStateStore``. The checkpoint doubles as a heartbeat: a snapshot that
+stops being refreshed belongs to a worker that died, and any other worker
+can claim it and persist the transcript it holds.
+
+The store is created by ``configure_call_state`` from the app lifespan and
+is available as ``call_state.store``. Backends, selected with
+``CALL_STATE_URL``:
+
+- ``memory://`` (default): in-process only; counts and recovery cover this
+  worker alone.
+- ``sqlite:///path/to/call_state.db``: a SQLite database in WAL mode shared
+  by the worker processes of a single node (e.g. all uvicorn or gunicorn
+  workers on one host). Single node only: WAL relies on shared memory and
+  does not work over a network filesystem.
+
+Deployments spanning several nodes need another backend (e.g. Redis),
+which only has to implement ``CallStateStore``.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+CALL_STATE_URL = os.getenv("CALL_STATE_URL", "memory://")
+CALL_STATE_CHECKPOINT_SECONDS = float(os.getenv("CALL_STATE_CHECKPOINT_SECONDS", 5))
+# Un snapshot sin actualizar durante este tiempo se considera huérfano
+CALL_STATE_STALE_SECONDS = float(os.getenv("CALL_STATE_STALE_SECONDS", 60))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class CallSnapshot:
+    """Point-in-time state of a live call."""
+
+    call_sid: str
+    stream_sid: Optional[str]
+    worker_id: str
+    started_at: float
+    updated_at: float
+    user_phone: Optional[str] = None
+    session_profile: Optional[str] = None
+    conversation: List[dict] = field(default_factory=list)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "CallSnapshot":
+        return cls(**json.loads(data))
+
+
+class CallStateStore(ABC):
+    """Storage for live-call snapshots. Methods are blocking and thread-safe."""
+
+    @abstractmethod
+    def save(self, snapshot: CallSnapshot):
+        """Insert or replace the snapshot for ``snapshot.call_sid``."""
+
+    @abstractmethod
+    def get(self, call_sid: str) -> Optional[CallSnapshot]:
+        """Return the snapshot for a call, if any."""
+
+    @abstractmethod
+    def delete(self, call_sid: str):
+        """Remove a call that has ended."""
+
+    @abstractmethod
+    def list_active(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> List[CallSnapshot]:
+        """Return snapshots refreshed within the last ``stale_after`` seconds."""
+
+    @abstractmethod
+    def claim_stale(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> List[CallSnapshot]:
+        """Atomically remove and return snapshots older than ``stale_after``.
+
+        Each orphaned call is returned to exactly one claimer.
+        """
+
+    def count_active(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> int:
+        return len(self.list_active(stale_after))
+
+
+class InMemoryCallStateStore(CallStateStore):
+    """Process-local store; useful for a single worker and for tests."""
+
+    def __init__(self):
+        self._snapshots: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def save(self, snapshot: CallSnapshot):
+        # Se guarda serializado para que el llamador pueda seguir mutando sus listas
+        with self._lock:
+            self._snapshots[snapshot.call_sid] = snapshot.to_json()
+
+    def get(self, call_sid: str) -> Optional[CallSnapshot]:
+        with self._lock:
+            data = self._snapshots.get(call_sid)
+        return CallSnapshot.from_json(data) if data else None
+
+    def delete(self, call_sid: str):
+        with self._lock:
+            self._snapshots.pop(call_sid, None)
+
+    def list_active(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> List[CallSnapshot]:
+        cutoff = time.time() - stale_after
+        with self._lock:
+            snapshots = [CallSnapshot.from_json(d) for d in self._snapshots.values()]
+        return [s for s in snapshots if s.updated_at >= cutoff]
+
+    def claim_stale(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> List[CallSnapshot]:
+        cutoff = time.time() - stale_after
+        with self._lock:
+            snapshots = [CallSnapshot.from_json(d) for d in self._snapshots.values()]
+            stale = [s for s in snapshots if s.updated_at < cutoff]
+            for snapshot in stale:
+                del self._snapshots[snapshot.call_sid]
+        return stale
+
+
+class SQLiteCallStateStore(CallStateStore):
+    """Store shared between processes through a SQLite database in WAL mode."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        # WAL: los lectores no bloquean al escritor y cada checkpoint es una escritura corta
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS call_state (
+                call_sid TEXT PRIMARY KEY,
+                worker_id TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS call_state_updated_at ON call_state (updated_at)"
+        )
+
+    def save(self, snapshot: CallSnapshot):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO call_state (call_sid, worker_id, updated_at, data) "
+                "VALUES (?, ?, ?, ?)",
+                (snapshot.call_sid, snapshot.worker_id, snapshot.updated_at, snapshot.to_json()),
+            )
+
+    def get(self, call_sid: str) -> Optional[CallSnapshot]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM call_state WHERE call_sid = ?", (call_sid,)
+            ).fetchone()
+        return CallSnapshot.from_json(row[0]) if row else None
+
+    def delete(self, call_sid: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM call_state WHERE call_sid = ?", (call_sid,))
+
+    def list_active(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> List[CallSnapshot]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM call_state WHERE updated_at >= ? ORDER BY updated_at",
+                (time.time() - stale_after,),
+            ).fetchall()
+        return [CallSnapshot.from_json(row[0]) for row in rows]
+
+    def count_active(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM call_state WHERE updated_at >= ?",
+                (time.time() - stale_after,),
+            ).fetchone()
+        return count
+
+    def claim_stale(self, stale_after: float = CALL_STATE_STALE_SECONDS) -> List[CallSnapshot]:
+        cutoff = time.time() - stale_after
+        with self._lock:
+            # BEGIN IMMEDIATE toma el lock de escritura: dos workers no reclaman la misma llamada
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT data FROM call_state WHERE updated_at < ?", (cutoff,)
+                ).fetchall()
+                self._conn.execute("DELETE FROM call_state WHERE updated_at < ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [CallSnapshot.from_json(row[0]) for row in rows]
+
+
+class LiveCall:
+    """Publishes the snapshots of one call handled by this worker.
+
+    ``checkpoint`` and ``close`` run in executor threads; the lock makes sure
+    a checkpoint still in flight when the call ends cannot re-insert the
+    snapshot after ``close`` removed it.
+    """
+
+    def __init__(self, store: CallStateStore, snapshot: CallSnapshot):
+        self.store = store
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def checkpoint(self, conversation: List[dict]):
+        with self._lock:
+            if self._closed:
+                return
+            self.snapshot.updated_at = time.time()
+            self.snapshot.conversation = conversation
+            self.store.save(self.snapshot)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self.store.delete(self.snapshot.call_sid)
+
+
+def create_call_state_store(url: str = CALL_STATE_URL) -> CallStateStore:
+    """Build the store configured by ``url`` (``memory://`` or ``sqlite:///path``)."""
+    if url.startswith("memory://"):
+        return InMemoryCallStateStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteCallStateStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported CALL_STATE_URL: {url}")
+
+
+def recover_orphaned_calls(store: CallStateStore, stale_after: float = CALL_STATE_STALE_SECONDS) -> int:
+    """Persist the transcripts of calls whose worker stopped checkpointing.
+
+    Each claimed call gets its last checkpointed conversation saved and is
+    finalized with the duration observed up to its last checkpoint. If that
+    write fails the snapshot is put back unchanged, still stale, so a later
+    round retries it. Does nothing without a database. Returns the number
+    of calls recovered.
+    """
+    import database
+
+    if not database.SessionLocal:
+        return 0
+
+    recovered = 0
+    for snapshot in store.claim_stale(stale_after):
+        print(
+            f"♻️  Recovering call {snapshot.call_sid} from worker {snapshot.worker_id} "
+            f"({len(snapshot.conversation)} interactions)"
+        )
+        name, _, version = (snapshot.session_profile or "").partition("@")
+        try:
+            database.save_recovered_call(
+                snapshot.call_sid,
+                snapshot.user_phone,
+                snapshot.conversation,
+                int(snapshot.updated_at - snapshot.started_at),
+                name or None,
+                int(version) if version.isdigit() else None,
+            )
+        except Exception as e:
+            # No perder la transcripción: se devuelve al store para reintentarlo
+            print(f"⚠️  Error saving recovered call {snapshot.call_sid}, will retry: {e}")
+            store.save(snapshot)
+            continue
+        recovered += 1
+    return recovered
+
+
+async def run_orphan_recovery(interval: float = CALL_STATE_STALE_SECONDS / 2):
+    """Claim and recover orphaned calls every ``interval`` seconds, off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, recover_orphaned_calls, store)
+        except Exception as e:
+            print(f"⚠️  Error recovering orphaned calls: {e}")
+
+
+store: Optional[CallStateStore] = None
+
+
+def configure_call_state(url: str = CALL_STATE_URL):
+    """Create the store from ``CALL_STATE_URL``; called from the app lifespan."""
+    global store
+
+    if store is None:
+        store = create_call_state_store(url)
+        print(f"✅ Call state store configured ({url.split('://')[0]})")
@@ -0,0 +1,374 @@
+"""Call analytics rollups.
+
+Finished calls are aggregated into ``call_stats_rollups`` rows per UTC hour
+and per UTC day: call count, total duration, a duration histogram (used for
+percentiles), status counts and intent counts.
+
+- ``record_finished_call`` updates the rollups incrementally; it is called
+  by ``finalize_call`` in the same transaction as the status change.
+- ``recompute_call_day`` recomputes the day of a call that was edited or
+  deleted through the API, in the same transaction as the change.
+- ``compact_rollups`` recomputes a time range exactly from ``calls``. It
+  runs periodically from the app lifespan and can be run by hand:
+  ``python call_stats.py --hours 720``.
+- ``backfill_rollups`` rolls up the whole call history when the rollup
+  table is empty (first deploy); it runs when the app starts and with
+  ``python call_stats.py --all``.
+- ``get_stats`` answers any time range by reading only rollup rows: whole
+  days from the daily rollups and the partial days at each end from the
+  hourly ones, so its cost does not depend on the size of ``calls``.
+"""
+import argparse
+import asyncio
+import os
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import database
+from models import Call, CallStatsRollup
+
+# Límites superiores (segundos) de cada cubeta del histograma de duración;
+# la última cubeta acumula todo lo que supere 3600s
+DURATION_BUCKETS = (5, 10, 15, 30, 45, 60, 90, 120, 180, 300, 600, 900, 1800, 3600)
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+PERCENTILES = (50, 90, 99)
+
+STATS_COMPACTION_INTERVAL_SECONDS = float(os.getenv("STATS_COMPACTION_INTERVAL_SECONDS", 3600))
+STATS_COMPACTION_LOOKBACK_HOURS = int(os.getenv("STATS_COMPACTION_LOOKBACK_HOURS", 48))
+
+
+def to_utc(value: datetime) -> datetime:
+    """Convert ``value`` to UTC; naive datetimes are taken to be UTC already."""
+    # SQLite devuelve datetimes naive; se asume que ya están en UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    """Start of the UTC hour or day containing ``value``."""
+    value = to_utc(value).replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        value = value.replace(hour=0)
+    return value
+
+
+def bucket_ceil(value: datetime, granularity: str) -> datetime:
+    """Smallest UTC hour or day boundary at or after ``value``."""
+    start = bucket_start(value, granularity)
+    return start if start == to_utc(value) else start + GRANULARITIES[granularity]
+
+
+class RollupTotals:
+    """In-memory accumulator with the same fields as a rollup row."""
+
+    def __init__(self):
+        self.call_count = 0
+        self.total_duration = 0
+        self.duration_histogram: Counter = Counter()
+        self.status_counts: Counter = Counter()
+        self.intent_counts: Counter = Counter()
+
+    def add_call(self, status: str, duration: Optional[int], user_intent: Optional[str]):
+        self.call_count += 1
+        self.status_counts[status] += 1
+        self.intent_counts[user_intent or "unknown"] += 1
+        if duration is not None:
+            self.total_duration += duration
+            self.duration_histogram[str(bisect_left(DURATION_BUCKETS, duration))] += 1
+
+    def add_rollup(self, rollup: CallStatsRollup):
+        self.call_count += rollup.call_count
+        self.total_duration += rollup.total_duration
+        self.duration_histogram.update(rollup.duration_histogram or {})
+        self.status_counts.update(rollup.status_counts or {})
+        self.intent_counts.update(rollup.intent_counts or {})
+
+    def write_to(self, rollup: CallStatsRollup):
+        # Reasignar los dicts: SQLAlchemy no detecta mutaciones in-place en columnas JSON
+        rollup.call_count = self.call_count
+        rollup.total_duration = self.total_duration
+        rollup.duration_histogram = dict(self.duration_histogram)
+        rollup.status_counts = dict(self.status_counts)
+        rollup.intent_counts = dict(self.intent_counts)
+
+    def duration_percentile(self, percentile: float) -> Optional[float]:
+        """Estimate a duration percentile by interpolating inside its bucket."""
+        measured = sum(self.duration_histogram.values())
+        if not measured:
+            return None
+
+        rank = measured * percentile / 100
+        seen = 0
+        for index in range(len(DURATION_BUCKETS) + 1):
+            count = self.duration_histogram.get(str(index), 0)
+            if count and seen + count >= rank:
+                lower = DURATION_BUCKETS[index - 1] if index > 0 else 0
+                if index == len(DURATION_BUCKETS):
+                    return float(lower)
+                upper = DURATION_BUCKETS[index]
+                return round(lower + (upper - lower) * (rank - seen) / count, 1)
+            seen += count
+        return float(DURATION_BUCKETS[-1])
+
+    def as_dict(self) -> dict:
+        measured = sum(self.duration_histogram.values())
+        return {
+            "call_count": self.call_count,
+            "total_duration": self.total_duration,
+            "avg_duration": round(self.total_duration / measured, 1) if measured else None,
+            "duration_percentiles": {
+                f"p{p}": self.duration_percentile(p) for p in PERCENTILES
+            },
+            "status_counts": dict(self.status_counts),
+            "intent_counts": dict(self.intent_counts),
+        }
+
+
+def _rollup_query(db: Session, granularity: str, start: datetime, end: datetime):
+    return db.query(CallStatsRollup).filter(
+        CallStatsRollup.granularity == granularity,
+        CallStatsRollup.bucket_start >= start,
+        CallStatsRollup.bucket_start < end,
+    )
+
+
+def _lock_rollup(db: Session, granularity: str, start: datetime) -> CallStatsRollup:
+    """Return the rollup row for a bucket, locked for update, creating it if needed."""
+    query = db.query(CallStatsRollup).filter(
+        CallStatsRollup.granularity == granularity,
+        CallStatsRollup.bucket_start == start,
+    ).with_for_update()
+
+    rollup = query.first()
+    if rollup:
+        return rollup
+
+    try:
+        with db.begin_nested():
+            rollup = CallStatsRollup(granularity=granularity, bucket_start=start)
+            RollupTotals().write_to(rollup)
+            db.add(rollup)
+        return rollup
+    except IntegrityError:
+        # Otro worker creó la fila al mismo tiempo
+        return query.one()
+
+
+def record_finished_call(db: Session, call: Call):
+    """Add a call that just finished to its hourly and daily rollups.
+
+    Does not commit; the caller commits together with the call update.
+    """
+    for granularity in GRANULARITIES:
+        rollup = _lock_rollup(db, granularity, bucket_start(call.start_time, granularity))
+        totals = RollupTotals()
+        totals.add_rollup(rollup)
+        totals.add_call(call.status, call.duration, call.user_intent)
+        totals.write_to(rollup)
+
+
+def record_intent_changes(db: Session, changes: Iterable[Tuple[datetime, Optional[str], Optional[str]]]):
+    """Move finished calls between intent counts in their rollups.
+
+    ``changes`` holds ``(start_time, old_intent, new_intent)`` per call. Only
+    existing rollup rows are adjusted; buckets that have never been rolled up
+    are filled in with their current intents by ``compact_rollups``. Does not
+    commit.
+    """
+    deltas: Dict[Tuple[str, datetime], Counter] = defaultdict(Counter)
+    for start_time, old_intent, new_intent in changes:
+        old_intent, new_intent = old_intent or "unknown", new_intent or "unknown"
+        if old_intent == new_intent:
+            continue
+        for granularity in GRANULARITIES:
+            delta = deltas[(granularity, bucket_start(start_time, granularity))]
+            delta[old_intent] -= 1
+            delta[new_intent] += 1
+
+    for granularity in GRANULARITIES:
+        starts = sorted(start for g, start in deltas if g == granularity)
+        if not starts:
+            continue
+        rollups = (
+            db.query(CallStatsRollup)
+            .filter(
+                CallStatsRollup.granularity == granularity,
+                CallStatsRollup.bucket_start.in_(starts),
+            )
+            .order_by(CallStatsRollup.bucket_start)
+            .with_for_update()
+        )
+        for rollup in rollups:
+            counts = Counter(rollup.intent_counts or {})
+            counts.update(deltas[(granularity, to_utc(rollup.bucket_start))])
+            rollup.intent_counts = {intent: n for intent, n in counts.items() if n > 0}
+
+
+def compact_rollups(db: Session, start: datetime, end: datetime) -> int:
+    """Recompute the rollups for every day touching ``[start, end)`` exactly.
+
+    Existing rollup rows in the range are locked first, so concurrent
+    ``record_finished_call`` updates wait for the compaction and then apply
+    on top of it. Does not commit. Returns the number of rows written.
+    """
+    start = bucket_start(start, "day")
+    end = bucket_ceil(end, "day")
+
+    existing: Dict[Tuple[str, datetime], CallStatsRollup] = {}
+    for granularity in GRANULARITIES:
+        for rollup in _rollup_query(db, granularity, start, end).with_for_update():
+            existing[(granularity, to_utc(rollup.bucket_start))] = rollup
+
+    totals: Dict[Tuple[str, datetime], RollupTotals] = defaultdict(RollupTotals)
+    rows = (
+        db.query(Call.start_time, Call.status, Call.duration, Call.user_intent)
+        .filter(Call.start_time >= start, Call.start_time < end, Call.status != "active")
+        .yield_per(10000)
+    )
+    for start_time, status, duration, user_intent in rows:
+        for granularity in GRANULARITIES:
+            totals[(granularity, bucket_start(start_time, granularity))].add_call(
+                status, duration, user_intent
+            )
+
+    for key in set(existing) | set(totals):
+        rollup = existing.get(key)
+        if rollup is None:
+            rollup = CallStatsRollup(granularity=key[0], bucket_start=key[1])
+            db.add(rollup)
+        totals.get(key, RollupTotals()).write_to(rollup)
+
+    return len(set(existing) | set(totals))
+
+
+def recompute_call_day(db: Session, start_time: datetime) -> int:
+    """Recompute the rollups of the UTC day containing ``start_time``.
+
+    For calls that were edited or deleted: flushes pending changes so the
+    recount sees them. Does not commit; the caller commits together with
+    the change.
+    """
+    db.flush()
+    day = bucket_start(start_time, "day")
+    return compact_rollups(db, day, day + GRANULARITIES["day"])
+
+
+def get_stats(db: Session, start: datetime, end: datetime) -> dict:
+    """Aggregate call statistics for ``[start, end)`` from the rollups only.
+
+    The range is widened to whole hours, the resolution of the rollups.
+    """
+    start = bucket_start(start, "hour")
+    end = bucket_ceil(end, "hour")
+    first_day = bucket_ceil(start, "day")
+    last_day = bucket_start(end, "day")
+
+    if first_day < last_day:
+        rollups = (
+            _rollup_query(db, "day", first_day, last_day).all()
+            + _rollup_query(db, "hour", start, first_day).all()
+            + _rollup_query(db, "hour", last_day, end).all()
+        )
+    else:
+        rollups = _rollup_query(db, "hour", start, end).all()
+
+    totals = RollupTotals()
+    for rollup in rollups:
+        totals.add_rollup(rollup)
+
+    return {"start": start, "end": end, **totals.as_dict()}
+
+
+def compact_recent(hours: Optional[int] = STATS_COMPACTION_LOOKBACK_HOURS):
+    """Recompute the rollups for the last ``hours`` hours in a new session.
+
+    ``hours=None`` recomputes the whole call history.
+    """
+    if not database.SessionLocal:
+        print("⚠️  Database not configured, skipping stats compaction")
+        return
+
+    end = datetime.now(timezone.utc)
+    db = database.SessionLocal()
+    try:
+        if hours is None:
+            start = db.query(func.min(Call.start_time)).scalar() or end
+        else:
+            start = end - timedelta(hours=hours)
+        written = compact_rollups(db, start, end)
+        db.commit()
+        scope = "all history" if hours is None else f"last {hours}h"
+        print(f"✅ Recomputed {written} call stats rollups ({scope})")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Error compacting call stats: {e}")
+    finally:
+        db.close()
+
+
+def backfill_rollups():
+    """Roll up the whole call history if no rollups exist yet.
+
+    Covers calls finalized before the rollups existed. A no-op once any
+    rollup row exists.
+    """
+    if not database.SessionLocal:
+        return
+
+    db = database.SessionLocal()
+    try:
+        if db.query(CallStatsRollup.id).first() is not None:
+            return
+        first_call = db.query(func.min(Call.start_time)).scalar()
+        if first_call is None:
+            return
+
+        print(f"Backfilling call stats rollups since {first_call}...")
+        written = compact_rollups(db, first_call, datetime.now(timezone.utc))
+        db.commit()
+        print(f"✅ Backfilled {written} call stats rollups")
+    except IntegrityError:
+        # Otro worker hizo el backfill al mismo tiempo
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Error backfilling call stats: {e}")
+    finally:
+        db.close()
+
+
+async def run_periodic_compaction(
+    interval: float = STATS_COMPACTION_INTERVAL_SECONDS,
+    hours: int = STATS_COMPACTION_LOOKBACK_HOURS,
+):
+    """Backfill empty rollups, then recompute recent ones every ``interval`` seconds.
+
+    Runs off the event loop. An ``interval`` of 0 only runs the backfill.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, backfill_rollups)
+    while interval > 0:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, compact_recent, hours)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute call stats rollups.")
+    parser.add_argument("--hours", type=int, default=STATS_COMPACTION_LOOKBACK_HOURS)
+    parser.add_argument("--all", action="store_true", help="Recompute the whole call history")
+    args = parser.parse_args()
+
+    database.configure_database()
+    database.init_db()
+    compact_recent(None if args.all else args.hours)
+
+
+if __name__ == "__main__":
+    main()
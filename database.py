@@ -3,36 +3,60 @@ import os
 from typing import Generator
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 
 from models import Base
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+engine = None
+SessionLocal = None
+
+
+def _database_url():
+    """Read DATABASE_URL from the environment, returning None if unusable."""
+    database_url = os.getenv("DATABASE_URL")
+
+    # Validate and clean DATABASE_URL
+    if database_url:
+        # Strip whitespace
+        database_url = database_url.strip()
+        
+        # Check if it's empty or just whitespace
+        if not database_url:
+            print("⚠️  WARNING: DATABASE_URL is empty. Database features disabled.")
+            return None
+        # Check for common malformed patterns
+        if "::" in database_url or database_url.endswith(":") or "://" not in database_url:
+            print(f"⚠️  WARNING: DATABASE_URL appears malformed: {database_url[:50]}...")
+            print("⚠️  Database features disabled. Please check your DATABASE_URL configuration.")
+            return None
+        return database_url
+
+    print("⚠️  INFO: DATABASE_URL not set. Database features disabled.")
+    return None
+
+
+def configure_database():
+    """Create the engine and session factory from DATABASE_URL.
+
+    Called from the application lifespan rather than at import time, so that
+    importing this module stays cheap. Calling it again is a no-op.
+    """
+    global engine, SessionLocal
+
+    if engine is not None:
+        return
+
+    database_url = _database_url()
+    if not database_url:
+        return
 
-# Validate and clean DATABASE_URL
-if DATABASE_URL:
-    # Strip whitespace
-    DATABASE_URL = DATABASE_URL.strip()
-    
-    # Check if it's empty or just whitespace
-    if not DATABASE_URL:
-        DATABASE_URL = None
-        print("⚠️  WARNING: DATABASE_URL is empty. Database features disabled.")
-    # Check for common malformed patterns
-    elif "::" in DATABASE_URL or DATABASE_URL.endswith(":") or "://" not in DATABASE_URL:
-        print(f"⚠️  WARNING: DATABASE_URL appears malformed: {DATABASE_URL[:50]}...")
-        print("⚠️  Database features disabled. Please check your DATABASE_URL configuration.")
-        DATABASE_URL = None
-
-# If DATABASE_URL is valid, set up the database
-if DATABASE_URL:
     try:
         # Create engine (no need to convert to asyncpg for sync)
         engine = create_engine(
-            DATABASE_URL,
+            database_url,
             echo=False,  # Set to True for debugging
             pool_pre_ping=True,  # Verify connections before using
             pool_recycle=3600,  # Recycle connections after 1 hour
@@ -53,11 +77,6 @@ if DATABASE_URL:
         print("⚠️  Database features disabled.")
         engine = None
         SessionLocal = None
-else:
-    engine = None
-    SessionLocal = None
-    if DATABASE_URL is None and os.getenv("DATABASE_URL") is None:
-        print("⚠️  INFO: DATABASE_URL not set. Database features disabled.")
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -87,6 +106,7 @@ def init_db():
     try:
         print("Creating database tables...")
         Base.metadata.create_all(bind=engine)
+        migrate_db()
         print("✅ Database tables created successfully")
     except Exception as e:
         print(f"⚠️  WARNING: Failed to initialize database: {e}")
@@ -94,12 +114,50 @@ def init_db():
         print("⚠️  Please check your DATABASE_URL and PostgreSQL connection.")
 
 
-def create_call(call_sid: str, user_phone: str) -> int:
+# Columnas e índices añadidos a "calls" después de su primera versión.
+# create_all no modifica tablas existentes, así que migrate_db los añade.
+CALLS_ADDED_COLUMNS = (
+    ("session_profile", "VARCHAR"),
+    ("session_profile_version", "INTEGER"),
+)
+CALLS_ADDED_INDEXES = ("start_time", "session_profile")
+
+
+def migrate_db():
+    """Bring an existing calls table up to date with the current model.
+
+    Idempotent: adds only the columns that are missing and creates indexes
+    with IF NOT EXISTS, so it is safe to run on every startup. The
+    equivalent manual DDL (PostgreSQL) is:
+
+        ALTER TABLE calls ADD COLUMN IF NOT EXISTS session_profile VARCHAR;
+        ALTER TABLE calls ADD COLUMN IF NOT EXISTS session_profile_version INTEGER;
+        CREATE INDEX IF NOT EXISTS ix_calls_start_time ON calls (start_time);
+        CREATE INDEX IF NOT EXISTS ix_calls_session_profile ON calls (session_profile);
+    """
+    existing = {column["name"] for column in inspect(engine).get_columns("calls")}
+    with engine.begin() as conn:
+        for name, column_type in CALLS_ADDED_COLUMNS:
+            if name not in existing:
+                print(f"Adding column calls.{name}...")
+                conn.execute(text(f"ALTER TABLE calls ADD COLUMN {name} {column_type}"))
+        for name in CALLS_ADDED_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_calls_{name} ON calls ({name})"))
+
+
+def create_call(
+    call_sid: str,
+    user_phone: str,
+    session_profile: str = None,
+    session_profile_version: int = None,
+) -> int:
     """Create a new call record in the database.
     
     Args:
         call_sid: Twilio call SID
         user_phone: User's phone number
+        session_profile: Name of the session profile used for the call
+        session_profile_version: Version of that session profile
         
     Returns:
         The ID of the created call record
@@ -116,7 +174,9 @@ def create_call(call_sid: str, user_phone: str) -> int:
             call_sid=call_sid,
             user_phone=user_phone,
             interaction_log=[],
-            status="active"
+            status="active",
+            session_profile=session_profile,
+            session_profile_version=session_profile_version,
         )
         db.add(call)
         db.commit()
@@ -184,12 +244,7 @@ def finalize_call(call_sid: str, duration: int = None, user_intent: str = None):
             print(f"⚠️  Call not found: {call_sid}")
             return
         
-        call.status = "completed"
-        if duration is not None:
-            call.duration = duration
-        if user_intent is not None:
-            call.user_intent = user_intent
-        
+        _complete_call(db, call, duration, user_intent)
         db.commit()
         print(f"✅ Finalized call {call_sid} (duration: {duration}s)")
     except Exception as e:
@@ -198,3 +253,65 @@ def finalize_call(call_sid: str, duration: int = None, user_intent: str = None):
     finally:
         db.close()
 
+
+
+def _complete_call(db: Session, call, duration: int = None, user_intent: str = None):
+    """Mark a call completed and, if it was active, add it to the stats rollups."""
+    from call_stats import record_finished_call
+
+    was_active = call.status == "active"
+    call.status = "completed"
+    if duration is not None:
+        call.duration = duration
+    if user_intent is not None:
+        call.user_intent = user_intent
+
+    # Actualizar las estadísticas agregadas en la misma transacción
+    if was_active:
+        record_finished_call(db, call)
+
+
+def save_recovered_call(
+    call_sid: str,
+    user_phone: str,
+    conversation_log: list,
+    duration: int,
+    session_profile: str = None,
+    session_profile_version: int = None,
+):
+    """Persist and finalize a call recovered from a dead worker, in one transaction.
+
+    Creates the call record if it was never written. Unlike the other
+    helpers, errors are raised so the caller can keep the transcript and
+    retry.
+    """
+    if not SessionLocal:
+        raise RuntimeError("Database not configured")
+
+    from models import Call
+
+    db = SessionLocal()
+    try:
+        call = db.query(Call).filter(Call.call_sid == call_sid).first()
+        if not call:
+            call = Call(
+                call_sid=call_sid,
+                user_phone=user_phone or "unknown",
+                interaction_log=[],
+                status="active",
+                session_profile=session_profile,
+                session_profile_version=session_profile_version,
+            )
+            db.add(call)
+            db.flush()
+            db.refresh(call)  # start_time lo asigna la base de datos
+        if conversation_log:
+            call.interaction_log = conversation_log
+        _complete_call(db, call, duration)
+        db.commit()
+        print(f"✅ Saved recovered call {call_sid} ({len(conversation_log)} interactions)")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,118 @@
+"""Graceful connection draining for rolling deploys.
+
+On SIGTERM the worker enters drain mode instead of exiting right away:
+
+1. New ``/media-stream`` connections and ``/make-call`` requests are refused
+   and the health check reports not-ready, so the load balancer stops
+   routing traffic here.
+2. Calls in progress are allowed to finish, up to ``DRAIN_TIMEOUT_SECONDS``.
+3. The original signal handler (uvicorn's) is then invoked so the server
+   shuts down; the lifespan shutdown waits for pending database writes,
+   up to ``DRAIN_FLUSH_TIMEOUT_SECONDS``, before the process exits.
+"""
+import asyncio
+import os
+import signal
+import time
+from typing import Callable, Set
+
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", 30))
+DRAIN_FLUSH_TIMEOUT_SECONDS = float(os.getenv("DRAIN_FLUSH_TIMEOUT_SECONDS", 10))
+DRAIN_POLL_INTERVAL = 0.5
+
+
+class DrainController:
+    """Tracks active media streams and pending database writes."""
+
+    def __init__(self, timeout: float, flush_timeout: float):
+        self.timeout = timeout
+        self.flush_timeout = flush_timeout
+        self.draining = False
+        self.active_streams = 0
+        self._pending_writes: Set[asyncio.Future] = set()
+        self._drain_task = None
+
+    def admit(self) -> bool:
+        """Register a new media stream. Returns False while draining."""
+        if self.draining:
+            return False
+        self.active_streams += 1
+        return True
+
+    def release(self):
+        """Unregister a media stream admitted with ``admit``."""
+        self.active_streams -= 1
+
+    async def run_write(self, fn: Callable, *args):
+        """Run a blocking database write in the default executor.
+
+        The write is tracked until it completes, and is shielded so that
+        cancelling the caller (e.g. a closing WebSocket) does not drop it.
+        """
+        future = asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        self._pending_writes.add(future)
+        future.add_done_callback(self._pending_writes.discard)
+        return await asyncio.shield(future)
+
+    async def drain(self):
+        """Stop admitting streams and wait for active ones to finish."""
+        self.draining = True
+        deadline = time.monotonic() + self.timeout
+        print(f"🚦 Draining: waiting for {self.active_streams} active call(s) (max {self.timeout:.0f}s)")
+
+        while self.active_streams > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+        if self.active_streams > 0:
+            print(f"⚠️  Drain deadline reached with {self.active_streams} call(s) still active")
+        else:
+            print("✅ All calls finished")
+
+    async def flush_writes(self):
+        """Wait for pending database writes to complete."""
+        if not self._pending_writes:
+            return
+
+        print(f"💾 Flushing {len(self._pending_writes)} pending database write(s)")
+        _, pending = await asyncio.wait(set(self._pending_writes), timeout=self.flush_timeout)
+        if pending:
+            print(f"⚠️  {len(pending)} database write(s) did not finish before shutdown")
+
+    def install_signal_handlers(self):
+        """Wrap the current SIGTERM handler so that draining happens first.
+
+        Must be called from the event loop thread after the server has
+        installed its own handlers (i.e. from the lifespan startup).
+        """
+        loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def forward(signum, frame):
+            if callable(previous):
+                previous(signum, frame)
+            else:
+                signal.signal(signum, previous)
+                signal.raise_signal(signum)
+
+        async def drain_then_forward(signum, frame):
+            await self.drain()
+            forward(signum, frame)
+
+        def handle_sigterm(signum, frame):
+            if self._drain_task is not None:
+                # Segundo SIGTERM: no esperar más
+                forward(signum, frame)
+                return
+            self._drain_task = loop.create_task(drain_then_forward(signum, frame))
+
+        def on_sigterm(signum, frame):
+            loop.call_soon_threadsafe(handle_sigterm, signum, frame)
+
+        try:
+            signal.signal(signal.SIGTERM, on_sigterm)
+        except ValueError:
+            # Solo el hilo principal puede instalar manejadores (p. ej. TestClient)
+            print("⚠️  Not in main thread, graceful draining on SIGTERM disabled")
+
+
+drain = DrainController(DRAIN_TIMEOUT_SECONDS, DRAIN_FLUSH_TIMEOUT_SECONDS)
@@ -1,17 +1,19 @@
-"""Initialize the database with the calls table."""
-import asyncio
+"""Initialize the database with the calls table.
 
-from database import init_db
+Also migrates an existing calls table (new columns and indexes); see
+``database.migrate_db`` for the equivalent manual DDL.
+"""
+from database import configure_database, init_db
 
 
-async def main():
-    """Initialize database tables."""
-    print("Creating database tables...")
-    await init_db()
-    print("✅ Database tables created successfully!")
-    print("\nTable created:")
-    print("  - calls (id, call_sid, user_phone, start_time, interaction_log, status, duration, user_intent)")
+def main():
+    """Initialize and migrate database tables."""
+    configure_database()
+    init_db()
+    print("\nTables created:")
+    print("  - calls (id, call_sid, user_phone, start_time, interaction_log, status, duration, user_intent, session_profile, session_profile_version)")
+    print("  - call_stats_rollups (granularity, bucket_start, call_count, total_duration, duration_histogram, status_counts, intent_counts)")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,234 @@
+"""Batch post-call intent tagging.
+
+Selects completed calls without ``user_intent``, classifies the user side
+of their ``interaction_log`` with a local keyword classifier and writes the
+results back with bulk updates. Usage:
+
+    python intent_tagging.py --workers 8 --batch-size 20000
+
+How it stays fast on large backfills:
+
+- Calls are read in primary-key order with keyset pagination
+  (``id > last_id``), so every batch is an index range scan.
+- Each batch is split into chunks that are classified in a process pool;
+  while the pool works, the next batch is already being read.
+- Results are written with one bulk update per batch, and the hourly/daily
+  stats rollups are adjusted in the same transaction.
+- After every committed batch the last processed id is saved to a
+  checkpoint file, so an interrupted run resumes where it stopped
+  (``--reset`` starts over). A run that reaches the end deletes the
+  checkpoint: calls still active during the run, or finalized out of id
+  order, get picked up by the next run, which starts again from id 0
+  (cheap, since only calls without ``user_intent`` are read).
+"""
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import database
+from call_stats import record_intent_changes
+from models import Call
+
+CHECKPOINT_PATH = os.getenv("INTENT_CHECKPOINT_PATH", "intent_tagging.checkpoint.json")
+
+NO_INTERACTION = "sin_interaccion"
+OTHER = "otro"
+
+# Palabras clave por intención (sin acentos, en minúsculas). En caso de empate
+# gana la intención que aparece primero.
+INTENT_KEYWORDS: Dict[str, Sequence[str]] = {
+    "no_interesado": (
+        "no me interesa", "no gracias", "no estoy interesad", "estoy ocupad",
+        "numero equivocado", "no me llame", "no vuelva", "quiteme de",
+    ),
+    "compra": (
+        "precio", "cuesta", "costo", "cuanto vale", "comprar", "compra", "pedido",
+        "ordenar", "adquirir", "envio", "pago", "pagar", "tarjeta", "distribuidor",
+        "promocion", "descuento", "donde lo consigo", "lo quiero",
+    ),
+    "contraindicaciones": (
+        "contraindicacion", "efectos secundarios", "efecto secundario", "embarazada",
+        "lactancia", "medicamento", "alergi", "es seguro", "riesgo", "mi doctor", "mi medico",
+    ),
+    "dosis_uso": (
+        "como se toma", "como lo tomo", "dosis", "cuantas capsulas", "capsula",
+        "al dia", "en ayunas", "cuanto tiempo", "cada cuando",
+    ),
+    "informacion_producto": (
+        "que es", "para que sirve", "beneficio", "como funciona", "ingrediente",
+        "componente", "antioxidante", "estudio", "olivo", "romero", "energia",
+        "envejecimiento", "colesterol", "diabetes", "inflamacion", "mitocondria",
+    ),
+}
+
+_PATTERNS = {
+    intent: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")")
+    for intent, keywords in INTENT_KEYWORDS.items()
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def classify_transcript(interaction_log: Optional[list]) -> str:
+    """Return the intent for a call from what the user said."""
+    user_text = " ".join(
+        entry.get("user", "") for entry in interaction_log or [] if isinstance(entry, dict)
+    ).strip()
+    if not user_text:
+        return NO_INTERACTION
+
+    text = _normalize(user_text)
+    best_intent, best_hits = OTHER, 0
+    for intent, pattern in _PATTERNS.items():
+        hits = len(pattern.findall(text))
+        if hits > best_hits:
+            best_intent, best_hits = intent, hits
+    return best_intent
+
+
+def classify_chunk(rows: List[Tuple[int, list]]) -> List[Tuple[int, str]]:
+    """Classify ``(call_id, interaction_log)`` pairs; runs in a worker process."""
+    return [(call_id, classify_transcript(log)) for call_id, log in rows]
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"last_id": 0, "processed": 0}
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # Escribir y renombrar: un corte a medias nunca deja un checkpoint corrupto
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _fetch_batch(db, last_id: int, batch_size: int) -> list:
+    return (
+        db.query(Call.id, Call.start_time, Call.interaction_log)
+        .filter(Call.id > last_id, Call.status == "completed", Call.user_intent.is_(None))
+        .order_by(Call.id)
+        .limit(batch_size)
+        .all()
+    )
+
+
+def _submit(pool: ProcessPoolExecutor, batch: list, chunk_size: int) -> list:
+    rows = [(row.id, row.interaction_log) for row in batch]
+    return [
+        pool.submit(classify_chunk, rows[i:i + chunk_size])
+        for i in range(0, len(rows), chunk_size)
+    ]
+
+
+def _write_results(db, batch: list, results: List[Tuple[int, str]]):
+    intents = dict(results)
+    db.bulk_update_mappings(
+        Call, [{"id": call_id, "user_intent": intent} for call_id, intent in results]
+    )
+    record_intent_changes(
+        db, [(row.start_time, None, intents[row.id]) for row in batch]
+    )
+    db.commit()
+
+
+def run_backfill(
+    batch_size: int = 10000,
+    chunk_size: int = 500,
+    workers: Optional[int] = None,
+    checkpoint_path: str = CHECKPOINT_PATH,
+    limit: Optional[int] = None,
+) -> int:
+    """Tag every completed call that has no intent yet. Returns calls tagged."""
+    if not database.SessionLocal:
+        print("⚠️  Database not configured, skipping intent tagging")
+        return 0
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint["last_id"]:
+        print(f"Resuming from call id {checkpoint['last_id']} ({checkpoint['processed']} already tagged)")
+
+    tagged = 0
+    started = time.perf_counter()
+    db = database.SessionLocal()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batch = _fetch_batch(db, checkpoint["last_id"], batch_size)
+            while batch and (limit is None or tagged < limit):
+                batch_started = time.perf_counter()
+                futures = _submit(pool, batch, chunk_size)
+
+                # Leer el siguiente lote mientras el pool clasifica el actual
+                next_batch = _fetch_batch(db, batch[-1].id, batch_size)
+
+                results = [pair for future in futures for pair in future.result()]
+                _write_results(db, batch, results)
+
+                tagged += len(results)
+                checkpoint = {
+                    "last_id": batch[-1].id,
+                    "processed": checkpoint["processed"] + len(results),
+                }
+                save_checkpoint(checkpoint_path, checkpoint)
+
+                batch_rate = len(results) / (time.perf_counter() - batch_started)
+                total_rate = tagged / (time.perf_counter() - started)
+                print(
+                    f"✅ Tagged {tagged} calls (last id {batch[-1].id}): "
+                    f"{batch_rate:,.0f} calls/s this batch, {total_rate:,.0f} calls/s overall"
+                )
+                batch = next_batch
+
+        # Sin más lotes: la pasada terminó y la siguiente vuelve a empezar desde el id 0
+        if not batch:
+            clear_checkpoint(checkpoint_path)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    rate = tagged / elapsed if elapsed else 0.0
+    print(f"✅ Intent tagging finished: {tagged} calls in {elapsed:.1f}s ({rate:,.0f} calls/s)")
+    return tagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tag completed calls with a user intent.")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Calls read and written per transaction")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Calls per process pool task")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after roughly this many calls")
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    if args.reset:
+        clear_checkpoint(args.checkpoint)
+
+    database.configure_database()
+    run_backfill(args.batch_size, args.chunk_size, args.workers, args.checkpoint, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,34 @@
 import asyncio
 import base64
 import json
+import logging
 import os
-from typing import List
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlencode
 
 import websockets
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket
+from fastapi import APIRouter, FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.websockets import WebSocketDisconnect
 from pydantic import BaseModel
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from twilio.rest import Client
 from twilio.twiml.voice_response import Connect, VoiceResponse
 
-from database import get_db, init_db, create_call, update_call_interaction, finalize_call
-from models import Call
-from schemas import CallListResponse, CallResponse, CallUpdate
+import call_state
+from call_state import CALL_STATE_CHECKPOINT_SECONDS, WORKER_ID, CallSnapshot, LiveCall
+from call_stats import run_periodic_compaction
+from database import configure_database, init_db, create_call, update_call_interaction, finalize_call
+from draining import drain
+from session_profiles import SessionProfile, registry as session_profiles
+from structured_logging import bind_call, configure_logging, log, log_event, shutdown_logging
 import api_routes
 
 load_dotenv()
 
 
-def load_prompt(file_name: str) -> str:
-    """Load system prompt from file."""
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    prompt_path = os.path.join(dir_path, "prompts", f"{file_name}.txt")
-
-    try:
-        with open(prompt_path, "r", encoding="utf-8") as file:
-            return file.read().strip()
-    except FileNotFoundError:
-        print(f"Could not find file: {prompt_path}")
-        raise
-
-
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
@@ -44,8 +36,6 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 NGROK_URL = os.getenv("NGROK_URL")
 PORT = int(os.getenv("PORT", 8000))
 
-SYSTEM_MESSAGE = load_prompt("system_prompt")
-VOICE = "shimmer"  # Mejor voz femenina para español mexicano
 LOG_EVENT_TYPES = [
     "response.content.done",
     "rate_limits.updated",
@@ -54,56 +44,109 @@ LOG_EVENT_TYPES = [
     "input_audio_buffer.speech_stopped",
     "input_audio_buffer.speech_started",
     "session.created",
+    "session.updated",
     "conversation.item.input_audio_transcription.completed",
 ]
 
-app = FastAPI(title="ORISOD Enzyme® Voice Assistant API", version="1.0.0")
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["https://call-asist.sistems-mik3.com", "http://localhost:4500"],  # Configure this properly in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def validate_config():
+    """Fail startup if required credentials are missing."""
+    if not OPENAI_API_KEY:
+        raise ValueError("Missing the OpenAI API key. Please set it in the .env file.")
+
+    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN or not TWILIO_PHONE_NUMBER:
+        raise ValueError("Missing Twilio configuration. Please set it in the .env file.")
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Validate configuration, set up the database and load session profiles."""
+    validate_config()
+    configure_logging()
 
-@app.on_event("startup")
-def startup_event():
-    """Initialize database on startup."""
     print("Initializing database...")
-    init_db()
+    configure_database()
+    await asyncio.get_running_loop().run_in_executor(None, init_db)
     print("Database initialized successfully!")
 
+    # Cargar perfiles de sesión y recargarlos en caliente cuando cambien
+    session_profiles.load()
+    profile_watcher = asyncio.create_task(session_profiles.watch())
 
-if not OPENAI_API_KEY:
-    raise ValueError("Missing the OpenAI API key. Please set it in the .env file.")
+    # Rollups de estadísticas: backfill si están vacíos y recálculo periódico (0 lo desactiva)
+    stats_compaction = asyncio.create_task(run_periodic_compaction())
 
-if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN or not TWILIO_PHONE_NUMBER:
-    raise ValueError("Missing Twilio configuration. Please set it in the .env file.")
+    # Estado compartido de llamadas en curso y recuperación de llamadas huérfanas
+    call_state.configure_call_state()
+    orphan_recovery = asyncio.create_task(call_state.run_orphan_recovery())
 
+    # SIGTERM: dejar de aceptar llamadas y esperar a las activas antes de salir
+    drain.install_signal_handlers()
 
-@app.get("/")
+    yield
+
+    profile_watcher.cancel()
+    orphan_recovery.cancel()
+    stats_compaction.cancel()
+    drain.draining = True
+    await drain.flush_writes()
+    shutdown_logging()
+
+
+router = APIRouter()
+
+
+@router.get("/")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint. Reports not-ready (503) while draining."""
+    if drain.draining:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "draining", "active_calls": drain.active_streams},
+        )
     return {"status": "healthy", "message": "ORISOD Enzyme® Voice Assistant is running!"}
 
 
+@lru_cache(maxsize=1)
+def get_twilio_client():
+    """Return a shared Twilio REST client.
+
+    twilio.rest is imported here rather than at module level: it costs about
+    55 ms of import time and is only needed to place outbound calls.
+    """
+    from twilio.rest import Client
+
+    return Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+
+
 class CallRequest(BaseModel):
     to_phone_number: str
+    profile: Optional[str] = None
 
 
-@app.post("/make-call")
+@router.post("/make-call")
 async def make_call(request: CallRequest):
     """Initiate an outbound call to the specified phone number."""
     if not request.to_phone_number:
         return {"error": "Phone number is required"}
 
+    if drain.draining:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Server is draining, retry on another instance", "status": "failed"},
+        )
+
+    if request.profile and request.profile not in session_profiles.names:
+        return {"error": f"Unknown session profile: {request.profile}", "status": "failed"}
+
+    outgoing_url = f"{NGROK_URL}/outgoing-call"
+    if request.profile:
+        outgoing_url += "?" + urlencode({"profile": request.profile})
+
     try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        client = get_twilio_client()
         call = client.calls.create(
-            url=f"{NGROK_URL}/outgoing-call",
+            url=outgoing_url,
             to=request.to_phone_number,
             from_=TWILIO_PHONE_NUMBER,
             record=True,
@@ -117,29 +160,33 @@ async def make_call(request: CallRequest):
         return {"error": str(e), "status": "failed"}
 
 
-@app.get("/outgoing-call", operation_id="handle_outgoing_call_get")
-async def handle_outgoing_call_get(request: Request):
-    """Handle outgoing call webhook (GET) and return TwiML response."""
+def build_stream_twiml(request: Request) -> HTMLResponse:
+    """Build the TwiML that connects the call to the media stream."""
     response = VoiceResponse()
     # Conectar directamente al asistente de OpenAI sin mensaje inicial de Twilio
     connect = Connect()
-    connect.stream(url=f"wss://{request.url.hostname}/media-stream")
+    stream = connect.stream(url=f"wss://{request.url.hostname}/media-stream")
+    # El perfil elegido en /make-call llega al WebSocket como customParameter
+    profile = request.query_params.get("profile")
+    if profile:
+        stream.parameter(name="profile", value=profile)
     response.append(connect)
     return HTMLResponse(content=str(response), media_type="application/xml")
 
 
-@app.post("/outgoing-call", operation_id="handle_outgoing_call_post")
+@router.get("/outgoing-call", operation_id="handle_outgoing_call_get")
+async def handle_outgoing_call_get(request: Request):
+    """Handle outgoing call webhook (GET) and return TwiML response."""
+    return build_stream_twiml(request)
+
+
+@router.post("/outgoing-call", operation_id="handle_outgoing_call_post")
 async def handle_outgoing_call_post(request: Request):
     """Handle outgoing call webhook (POST) and return TwiML response."""
-    response = VoiceResponse()
-    # Conectar directamente al asistente de OpenAI sin mensaje inicial de Twilio
-    connect = Connect()
-    connect.stream(url=f"wss://{request.url.hostname}/media-stream")
-    response.append(connect)
-    return HTMLResponse(content=str(response), media_type="application/xml")
+    return build_stream_twiml(request)
 
 
-@app.api_route("/recording-status", methods=["POST"], operation_id="handle_recording_status")
+@router.api_route("/recording-status", methods=["POST"], operation_id="handle_recording_status")
 async def handle_recording_status(request: Request):
     """Handle recording status updates from Twilio."""
     form_data = await request.form()
@@ -157,19 +204,34 @@ async def handle_recording_status(request: Request):
     return {"status": "received"}
 
 
-@app.websocket("/media-stream")
+@router.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket):
     """Handle WebSocket connections between Twilio and OpenAI."""
-    print("Client connected")
+    if not drain.admit():
+        print("Rejecting media stream: server is draining")
+        await websocket.close(code=1013, reason="Server is draining")
+        return
+
+    try:
+        await relay_media_stream(websocket)
+    finally:
+        drain.release()
+
+
+async def relay_media_stream(websocket: WebSocket):
+    """Relay audio between the Twilio media stream and the OpenAI Realtime API."""
+    # Contexto de log de la llamada: los SIDs se completan con el evento "start"
+    call_context = bind_call()
+    log(logging.INFO, "Client connected")
     await websocket.accept()
 
     # Verificar que la API key esté configurada
     if not OPENAI_API_KEY:
-        print("ERROR: OPENAI_API_KEY no está configurada")
+        log(logging.ERROR, "ERROR: OPENAI_API_KEY no está configurada")
         await websocket.close(code=1008, reason="OpenAI API key not configured")
         return
     
-    print(f"Connecting to OpenAI Realtime API (key: {OPENAI_API_KEY[:8]}...)")
+    log(logging.INFO, "Connecting to OpenAI Realtime API", key_prefix=OPENAI_API_KEY[:8])
 
     try:
         async with websockets.connect(
@@ -179,7 +241,6 @@ async def handle_media_stream(websocket: WebSocket):
                 "OpenAI-Beta": "realtime=v1",
             },
         ) as openai_ws:
-            await send_session_update(openai_ws)
             stream_sid = None
             session_id = None
             greeting_sent = False
@@ -191,9 +252,26 @@ async def handle_media_stream(websocket: WebSocket):
             current_user_text = None
             current_ai_text = None
 
+            # Estado publicado en el call-state store compartido mientras dura la llamada
+            live_call = None
+
+            async def checkpoint_call_state():
+                """Checkpoint the call periodically; also serves as its heartbeat."""
+                loop = asyncio.get_running_loop()
+                while True:
+                    await asyncio.sleep(CALL_STATE_CHECKPOINT_SECONDS)
+                    if live_call is None:
+                        continue
+                    try:
+                        await loop.run_in_executor(
+                            None, live_call.checkpoint, list(conversation_buffer)
+                        )
+                    except Exception as e:
+                        log(logging.ERROR, "Error checkpointing call state", error=str(e))
+
             async def receive_from_twilio():
                 """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
-                nonlocal stream_sid, greeting_sent, call_sid, call_start_time
+                nonlocal stream_sid, greeting_sent, call_sid, call_start_time, live_call
                 try:
                     async for message in websocket.iter_text():
                         data = json.loads(message)
@@ -206,35 +284,54 @@ async def handle_media_stream(websocket: WebSocket):
                         elif data["event"] == "start":
                             stream_sid = data["start"]["streamSid"]
                             call_sid = data["start"]["callSid"]
+                            call_context.update(call_sid=call_sid, stream_sid=stream_sid)
                             
                             # Extract phone number from metadata if available
-                            user_phone = data["start"].get("customParameters", {}).get("from", "unknown")
+                            custom_parameters = data["start"].get("customParameters", {})
+                            user_phone = custom_parameters.get("from", "unknown")
                             
-                            print(f"Incoming stream has started {stream_sid}")
-                            print(f"Call SID: {call_sid}, Phone: {user_phone}")
+                            log(logging.INFO, "Incoming stream has started", user_phone=user_phone)
+                            
+                            # El perfil se fija al inicio de la llamada; las recargas no la afectan
+                            profile = resolve_session_profile(custom_parameters.get("profile"))
+                            await send_session_update(openai_ws, profile)
                             
                             # Create call record in database
                             import time
                             call_start_time = time.time()
-                            create_call(call_sid, user_phone)
+                            create_call(call_sid, user_phone, profile.name, profile.version)
+                            live_call = LiveCall(call_state.store, CallSnapshot(
+                                call_sid=call_sid,
+                                stream_sid=stream_sid,
+                                worker_id=WORKER_ID,
+                                started_at=call_start_time,
+                                updated_at=call_start_time,
+                                user_phone=user_phone,
+                                session_profile=profile.label,
+                            ))
+                            await asyncio.get_running_loop().run_in_executor(
+                                None, live_call.checkpoint, []
+                            )
                             
                             # Enviar saludo inicial cuando el stream comienza
                             if not greeting_sent:
                                 await send_initial_greeting(openai_ws)
                                 greeting_sent = True
                 except WebSocketDisconnect:
-                    print("Client disconnected.")
+                    log(logging.INFO, "Client disconnected.")
                 finally:
-                    # Guardar la conversación completa en la base de datos
-                    if call_sid and conversation_buffer:
-                        print(f"💾 Saving complete conversation ({len(conversation_buffer)} interactions)")
-                        update_call_interaction(call_sid, conversation_buffer)
-                    
-                    # Finalize call in database
-                    if call_sid and call_start_time:
+                    # Twilio colgó: cerrar OpenAI para que send_to_twilio termine y se
+                    # libere el stream (si no, gather espera a un socket que nunca habla)
+                    await openai_ws.close()
+
+                    # Guardar la conversación y finalizar la llamada fuera del event loop;
+                    # el drenaje espera a que estas escrituras terminen antes de salir
+                    if call_sid:
                         import time
-                        duration = int(time.time() - call_start_time)
-                        finalize_call(call_sid, duration=duration)
+                        duration = int(time.time() - call_start_time) if call_start_time else None
+                        await drain.run_write(
+                            save_call_end, call_sid, list(conversation_buffer), duration, live_call
+                        )
 
             async def send_to_twilio():
                 """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
@@ -243,18 +340,16 @@ async def handle_media_stream(websocket: WebSocket):
                     async for openai_message in openai_ws:
                         response = json.loads(openai_message)
                         if response["type"] in LOG_EVENT_TYPES:
-                            print(f"Received event: {response['type']}", response)
+                            log_event(response["type"], response)
                         if response["type"] == "session.created":
                             session_id = response["session"]["id"]
-                        if response["type"] == "session.updated":
-                            print("Session updated successfully:", response)
                         
                         # Capture user transcription from the transcription completed event
                         if response["type"] == "conversation.item.input_audio_transcription.completed":
                             transcript = response.get("transcript", "")
                             if transcript:
                                 current_user_text = transcript
-                                print(f"📝 User said: {current_user_text}")
+                                log(logging.INFO, "User said", transcript=current_user_text)
                         
                         # Capture AI response text from response.done event
                         if response["type"] == "response.done":
@@ -266,7 +361,7 @@ async def handle_media_stream(websocket: WebSocket):
                                     for c in content:
                                         if c.get("type") == "audio" and "transcript" in c:
                                             current_ai_text = c["transcript"]
-                                            print(f"🤖 AI responded: {current_ai_text}")
+                                            log(logging.INFO, "AI responded", transcript=current_ai_text)
                                             break
                             
                             # Guardar el par de interacción en el buffer solo si tenemos ambos textos
@@ -280,7 +375,7 @@ async def handle_media_stream(websocket: WebSocket):
                                     "timestamp": timestamp
                                 }
                                 conversation_buffer.append(interaction)
-                                print(f"✅ Buffered interaction #{len(conversation_buffer)}: user + ai")
+                                log(logging.DEBUG, "Buffered interaction", interaction=len(conversation_buffer))
                                 
                                 # Reset para la siguiente interacción
                                 current_user_text = None
@@ -296,7 +391,7 @@ async def handle_media_stream(websocket: WebSocket):
                                     "timestamp": timestamp
                                 }
                                 conversation_buffer.append(interaction)
-                                print(f"✅ Buffered initial greeting #{len(conversation_buffer)}")
+                                log(logging.DEBUG, "Buffered initial greeting", interaction=len(conversation_buffer))
                                 
                                 # Reset
                                 current_ai_text = None
@@ -315,10 +410,10 @@ async def handle_media_stream(websocket: WebSocket):
                                 }
                                 await websocket.send_json(audio_delta)
                             except Exception as e:
-                                print(f"Error processing audio data: {e}")
+                                log(logging.ERROR, "Error processing audio data", error=str(e))
                         
                         if response["type"] == "input_audio_buffer.speech_started":
-                            print("Speech started, interrupting AI response")
+                            log(logging.INFO, "Speech started, interrupting AI response")
 
                             await websocket.send_json(
                                 {"streamSid": stream_sid, "event": "clear"}
@@ -327,14 +422,20 @@ async def handle_media_stream(websocket: WebSocket):
                             interrupt_message = {"type": "response.cancel"}
                             await openai_ws.send(json.dumps(interrupt_message))
                 except Exception as e:
-                    print(f"Error in send_to_twilio: {e}")
+                    log(logging.ERROR, "Error in send_to_twilio", error=str(e))
                 finally:
                     # Guardar la conversación al terminar el stream de OpenAI
                     if call_sid and conversation_buffer:
-                        print(f"💾 Saving complete conversation on stream end ({len(conversation_buffer)} interactions)")
-                        update_call_interaction(call_sid, conversation_buffer)
-
-            await asyncio.gather(receive_from_twilio(), send_to_twilio())
+                        log(logging.INFO, "Saving complete conversation on stream end", interactions=len(conversation_buffer))
+                        await drain.run_write(
+                            update_call_interaction, call_sid, list(conversation_buffer)
+                        )
+
+            checkpointer = asyncio.create_task(checkpoint_call_state())
+            try:
+                await asyncio.gather(receive_from_twilio(), send_to_twilio())
+            finally:
+                checkpointer.cancel()
     
     except Exception as e:
         error_msg = str(e)
@@ -353,31 +454,40 @@ async def handle_media_stream(websocket: WebSocket):
 
 
 
-async def send_session_update(openai_ws):
-    """Configure OpenAI session with audio settings and instructions."""
-    session_update = {
-        "type": "session.update",
-        "session": {
-            "input_audio_format": "g711_ulaw",
-            "output_audio_format": "g711_ulaw",
-            "voice": VOICE,
-            "instructions": SYSTEM_MESSAGE,
-            "modalities": ["text", "audio"],
-            "temperature": 0.8,  # Mayor temperatura para respuestas más naturales
-            "turn_detection": {
-                "type": "server_vad",
-                "threshold": 0.6,  # Umbral más alto para evitar falsos positivos
-                "prefix_padding_ms": 400,  # Más padding para capturar inicio de palabras
-                "silence_duration_ms": 700,  # Más tiempo de silencio para español mexicano
-            },
-            "input_audio_transcription": {
-                "model": "whisper-1",
-                "language": "es"  # Forzar español para mejor reconocimiento
-            },
-        },
-    }
-    print("Configuring OpenAI session for Mexican Spanish")
-    await openai_ws.send(json.dumps(session_update))
+def save_call_end(
+    call_sid: str,
+    conversation_buffer: list,
+    duration: Optional[int],
+    live_call: Optional[LiveCall] = None,
+):
+    """Persist the full conversation, finalize the call record and unpublish it."""
+    # Guardar la conversación completa en la base de datos
+    if conversation_buffer:
+        print(f"💾 Saving complete conversation ({len(conversation_buffer)} interactions)")
+        update_call_interaction(call_sid, conversation_buffer)
+
+    # Finalize call in database
+    if duration is not None:
+        finalize_call(call_sid, duration=duration)
+
+    # Ya persistida: retirarla del call-state store compartido
+    if live_call is not None:
+        live_call.close()
+
+
+def resolve_session_profile(name: Optional[str]) -> SessionProfile:
+    """Return the requested session profile, falling back to the default one."""
+    try:
+        return session_profiles.get(name)
+    except KeyError:
+        log(logging.WARNING, "Unknown session profile, using default", profile=name)
+        return session_profiles.get()
+
+
+async def send_session_update(openai_ws, profile: SessionProfile):
+    """Configure OpenAI session with the profile's pre-serialized session.update."""
+    log(logging.INFO, "Configuring OpenAI session", profile=profile.label)
+    await openai_ws.send(profile.payload)
 
 
 async def send_initial_greeting(openai_ws):
@@ -403,14 +513,37 @@ async def send_initial_greeting(openai_ws):
         "type": "response.create"
     }
     await openai_ws.send(json.dumps(response_create))
-    print("Initial greeting sent to OpenAI")
+    log(logging.INFO, "Initial greeting sent to OpenAI")
 
 
 
 # ============================================================================
-# INCLUDE API ROUTER
+# APP FACTORY
 # ============================================================================
 
-# Include API routes from api_routes.py
-app.include_router(api_routes.router)
+def create_app() -> FastAPI:
+    """Build the FastAPI application.
+
+    Use ``uvicorn --factory main:create_app`` to build the app inside the
+    worker, or ``main:app`` for the module-level instance.
+    """
+    app = FastAPI(
+        title="ORISOD Enzyme® Voice Assistant API", version="1.0.0", lifespan=lifespan
+    )
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["https://call-asist.sistems-mik3.com", "http://localhost:4500"],  # Configure this properly in production
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.include_router(router)
+    # Include API routes from api_routes.py
+    app.include_router(api_routes.router)
+    return app
+
 
+app = create_app()
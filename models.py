@@ -2,7 +2,7 @@
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import JSON, Column, DateTime, Integer, String, Text
+from sqlalchemy import JSON, Column, DateTime, Integer, String, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -17,11 +17,36 @@ class Call(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     call_sid = Column(String, unique=True, index=True, nullable=False)
     user_phone = Column(String, nullable=False)
-    start_time = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    start_time = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
     interaction_log = Column(JSON, nullable=False, default=list)
     status = Column(String, nullable=False, default="active")
     duration = Column(Integer, nullable=True)  # in seconds
     user_intent = Column(String, nullable=True)
+    session_profile = Column(String, nullable=True, index=True)
+    session_profile_version = Column(Integer, nullable=True)
 
     def __repr__(self):
         return f"<Call(id={self.id}, call_sid={self.call_sid}, status={self.status})>"
+
+
+class CallStatsRollup(Base):
+    """Pre-aggregated call statistics for one hour or one day (UTC).
+
+    Maintained incrementally by ``finalize_call`` and recomputed exactly by
+    ``call_stats.compact_rollups``. Only finished calls are counted.
+    """
+
+    __tablename__ = "call_stats_rollups"
+    __table_args__ = (UniqueConstraint("granularity", "bucket_start"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    granularity = Column(String, nullable=False)  # "hour" | "day"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    call_count = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Integer, nullable=False, default=0)  # in seconds
+    duration_histogram = Column(JSON, nullable=False, default=dict)  # {bucket index: count}
+    status_counts = Column(JSON, nullable=False, default=dict)
+    intent_counts = Column(JSON, nullable=False, default=dict)
+
+    def __repr__(self):
+        return f"<CallStatsRollup({self.granularity} {self.bucket_start}, calls={self.call_count})>"
@@ -45,6 +45,8 @@ class CallResponse(CallBase):
     status: str
     duration: Optional[int] = None
     user_intent: Optional[str] = None
+    session_profile: Optional[str] = None
+    session_profile_version: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,193 @@
+"""Versioned session profiles for the OpenAI Realtime API.
+
+Profiles are defined in ``prompts/session_profiles.yaml``. Each one is turned
+into a ready-to-send ``session.update`` message once, when it is loaded, so a
+new call only has to pick a profile and send its pre-serialized payload.
+
+The registry watches the profiles file and the prompt files it references and
+reloads them when they change. A reload builds a complete new set of profiles
+and swaps it in with a single assignment, so a call that already picked a
+profile keeps using it until it ends.
+
+Calls store the profile name and version, so a profile whose settings or
+prompt change must also get a new ``version``; a reload that changes a
+profile's payload without bumping its version is rejected.
+"""
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import yaml
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "prompts")
+PROFILES_PATH = os.getenv(
+    "SESSION_PROFILES_PATH", os.path.join(PROMPTS_DIR, "session_profiles.yaml")
+)
+PROFILE_RELOAD_INTERVAL = float(os.getenv("SESSION_PROFILES_RELOAD_INTERVAL", 2.0))
+
+
+@dataclass(frozen=True)
+class SessionProfile:
+    """An immutable, pre-serialized session configuration."""
+
+    name: str
+    version: int
+    voice: str
+    instructions: str = field(repr=False)
+    temperature: float
+    turn_detection: dict = field(repr=False)
+    payload: str = field(repr=False)
+
+    @property
+    def label(self) -> str:
+        """Profile identifier as stored on each call, e.g. ``default@3``."""
+        return f"{self.name}@{self.version}"
+
+
+def build_session_update(
+    voice: str, instructions: str, temperature: float, turn_detection: dict
+) -> dict:
+    """Build the ``session.update`` message sent to OpenAI."""
+    return {
+        "type": "session.update",
+        "session": {
+            "input_audio_format": "g711_ulaw",
+            "output_audio_format": "g711_ulaw",
+            "voice": voice,
+            "instructions": instructions,
+            "modalities": ["text", "audio"],
+            "temperature": temperature,
+            "turn_detection": turn_detection,
+            "input_audio_transcription": {
+                "model": "whisper-1",
+                "language": "es"  # Forzar español para mejor reconocimiento
+            },
+        },
+    }
+
+
+def _prompt_path(file_name: str) -> str:
+    return os.path.join(PROMPTS_DIR, f"{file_name}.txt")
+
+
+def _read_prompt(file_name: str) -> str:
+    with open(_prompt_path(file_name), "r", encoding="utf-8") as file:
+        return file.read().strip()
+
+
+def _build_profile(name: str, spec: dict) -> SessionProfile:
+    if "instructions_file" in spec:
+        instructions = _read_prompt(spec["instructions_file"])
+    else:
+        instructions = spec["instructions"]
+
+    voice = spec["voice"]
+    temperature = float(spec["temperature"])
+    turn_detection = dict(spec["turn_detection"])
+    payload = json.dumps(
+        build_session_update(voice, instructions, temperature, turn_detection)
+    )
+    return SessionProfile(
+        name=name,
+        version=int(spec["version"]),
+        voice=voice,
+        instructions=instructions,
+        temperature=temperature,
+        turn_detection=turn_detection,
+        payload=payload,
+    )
+
+
+class ProfileRegistry:
+    """Holds the current set of session profiles and reloads it on change."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._profiles: Dict[str, SessionProfile] = {}
+        self._default: Optional[str] = None
+        self._instruction_files: Tuple[str, ...] = ()
+        self._mtimes: Dict[str, float] = {}
+
+    def _watched_mtimes(self, instruction_files) -> Dict[str, float]:
+        paths = [self.path] + [_prompt_path(f) for f in instruction_files]
+        return {p: os.stat(p).st_mtime for p in paths if os.path.exists(p)}
+
+    def load(self):
+        """Load every profile from disk and swap them in atomically.
+
+        Raises on invalid files, or when a profile changed without a new
+        version, leaving the previous profiles in place.
+        """
+        with open(self.path, "r", encoding="utf-8") as file:
+            config = yaml.safe_load(file) or {}
+
+        specs = config.get("profiles") or {}
+        if not specs:
+            raise ValueError(f"No session profiles defined in {self.path}")
+
+        profiles = {name: _build_profile(name, spec) for name, spec in specs.items()}
+        default = config.get("default_profile") or next(iter(profiles))
+        if default not in profiles:
+            raise ValueError(f"Default session profile '{default}' is not defined")
+
+        # Misma versión con otro contenido mezclaría llamadas distintas en las métricas
+        for name, profile in profiles.items():
+            previous = self._profiles.get(name)
+            if previous and previous.version == profile.version and previous.payload != profile.payload:
+                raise ValueError(
+                    f"Session profile '{name}' changed but its version is still "
+                    f"{profile.version}; bump the version to apply the change"
+                )
+
+        instruction_files = tuple(
+            sorted({s["instructions_file"] for s in specs.values() if "instructions_file" in s})
+        )
+        mtimes = self._watched_mtimes(instruction_files)
+
+        # Una sola asignación: las llamadas nuevas ven todos los perfiles nuevos o ninguno
+        self._profiles, self._default = profiles, default
+        self._instruction_files, self._mtimes = instruction_files, mtimes
+        print(
+            "✅ Loaded session profiles: "
+            + ", ".join(p.label for p in profiles.values())
+        )
+
+    def reload_if_changed(self) -> bool:
+        """Reload profiles if any watched file changed. Returns True on reload."""
+        current = self._watched_mtimes(self._instruction_files)
+        if current == self._mtimes:
+            return False
+
+        try:
+            self.load()
+            return True
+        except Exception as e:
+            # Mantener los perfiles anteriores si el archivo nuevo es inválido
+            print(f"⚠️  Failed to reload session profiles, keeping previous ones: {e}")
+            self._mtimes = current
+            return False
+
+    async def watch(self, interval: float = PROFILE_RELOAD_INTERVAL):
+        """Poll the watched files forever, reloading profiles on change."""
+        while True:
+            await asyncio.sleep(interval)
+            self.reload_if_changed()
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._profiles)
+
+    def get(self, name: Optional[str] = None) -> SessionProfile:
+        """Return the named profile, or the default one when ``name`` is empty.
+
+        Raises:
+            KeyError: If no profile with that name exists.
+        """
+        if not self._profiles:
+            self.load()
+        return self._profiles[name or self._default]
+
+
+registry = ProfileRegistry(PROFILES_PATH)
@@ -0,0 +1,222 @@
+"""Non-blocking structured logging for the audio relay hot path.
+
+Log calls on the relay only capture a record and put it on an in-memory
+queue; a background thread (``logging.handlers.QueueListener``) does the
+JSON serialization and the stdout write. If the queue is full the record is
+dropped and counted instead of blocking the event loop.
+
+OpenAI events are logged through ``log_event``, which applies per-event-type
+levels and sampling rates before doing any work. Large payloads and fields
+are clipped to a character budget *before* they are serialized: the C JSON
+encoder holds the GIL for a whole ``json.dumps`` call, so dumping a full
+``response.done`` body in the writer thread would still stall the event
+loop. ``call_sid`` and ``stream_sid`` come from
+the call context created with ``bind_call``, so every line logged while
+handling a call carries them automatically.
+
+Configuration (environment variables):
+
+- ``LOG_LEVEL``: minimum level, default ``INFO``.
+- ``LOG_EVENT_LEVELS``: per-event levels, e.g. ``response.done=DEBUG,session.created=INFO``.
+- ``LOG_EVENT_SAMPLING``: per-event sample rates, e.g. ``rate_limits.updated=0.1``.
+- ``LOG_PAYLOAD_MAX_CHARS``: character budget per payload or field, default 2000.
+- ``LOG_QUEUE_SIZE``: records buffered before dropping, default 10000.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Un dict mutable por llamada: las tareas hijas (asyncio.gather) copian el
+# ContextVar al crearse, pero comparten el mismo dict y ven los SIDs que se
+# asignan después, cuando llega el evento "start" de Twilio.
+call_context_var: ContextVar[Optional[dict]] = ContextVar("call_context", default=None)
+
+# Eventos grandes o muy frecuentes: solo en DEBUG salvo que se configure otra cosa
+DEFAULT_EVENT_LEVELS = {
+    "rate_limits.updated": logging.DEBUG,
+    "response.done": logging.DEBUG,
+    "response.content.done": logging.DEBUG,
+}
+
+logger = logging.getLogger("relay")
+
+
+def _parse_mapping(value: str, convert) -> dict:
+    mapping = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, raw = item.partition("=")
+        mapping[key.strip()] = convert(raw.strip())
+    return mapping
+
+
+def _level(name: str) -> int:
+    return logging.getLevelName(name.upper()) if not name.isdigit() else int(name)
+
+
+EVENT_LEVELS: Dict[str, int] = {
+    **DEFAULT_EVENT_LEVELS,
+    **_parse_mapping(os.getenv("LOG_EVENT_LEVELS", ""), _level),
+}
+EVENT_SAMPLING: Dict[str, float] = _parse_mapping(os.getenv("LOG_EVENT_SAMPLING", ""), float)
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 2000))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, truncating payloads."""
+
+    def __init__(self, max_payload_chars: int = PAYLOAD_MAX_CHARS):
+        super().__init__()
+        self.max_payload_chars = max_payload_chars
+
+    def _clip(self, value, remaining: int):
+        """Copy ``value`` keeping at most ``remaining`` characters of content.
+
+        Returns ``(clipped, remaining)``. The walk stops once the budget is
+        spent, so its cost is bounded no matter how large ``value`` is.
+        """
+        if isinstance(value, str):
+            if len(value) > remaining:
+                return f"{value[:remaining]}…(+{len(value) - remaining} chars)", 0
+            return value, remaining - max(len(value), 1)
+        if isinstance(value, dict):
+            clipped = {}
+            for index, (key, item) in enumerate(value.items()):
+                if remaining <= 0:
+                    clipped["…"] = f"+{len(value) - index} keys"
+                    break
+                clipped[key], remaining = self._clip(item, remaining - len(str(key)))
+            return clipped, remaining
+        if isinstance(value, (list, tuple)):
+            clipped = []
+            for index, item in enumerate(value):
+                if remaining <= 0:
+                    clipped.append(f"…(+{len(value) - index} items)")
+                    break
+                item, remaining = self._clip(item, remaining)
+                clipped.append(item)
+            return clipped, remaining
+        if value is None or isinstance(value, (bool, int, float)):
+            return value, remaining - 8
+        return self._clip(str(value), remaining)
+
+    def _truncate(self, value):
+        return self._clip(value, self.max_payload_chars)[0]
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("call_sid", "stream_sid", "event"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update((key, self._truncate(value)) for key, value in fields.items())
+        payload = getattr(record, "payload", None)
+        if payload is not None:
+            entry["payload"] = self._truncate(payload)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers formatting to the listener thread.
+
+    The stock handler formats the message in the calling thread; here only
+    the call context is captured, and full queues drop records instead of
+    raising.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        context = call_context_var.get()
+        if context:
+            record.call_sid = context.get("call_sid")
+            record.stream_sid = context.get("stream_sid")
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            ContextQueueHandler.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(stream=None):
+    """Attach the queue handler to the relay logger and start the writer thread."""
+    global _listener
+
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    logger.handlers = [ContextQueueHandler(log_queue)]
+    logger.setLevel(_level(os.getenv("LOG_LEVEL", "INFO")))
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+
+    if _listener is None:
+        return
+
+    _listener.stop()
+    _listener = None
+    if ContextQueueHandler.dropped:
+        print(f"⚠️  {ContextQueueHandler.dropped} log record(s) dropped (queue full)")
+
+
+def bind_call(**ids) -> dict:
+    """Start a logging context for a call in the current task.
+
+    Returns the context dict; set ``call_sid``/``stream_sid`` on it once they
+    are known and records logged from this task and the tasks it spawns will
+    carry them.
+    """
+    context = dict(ids)
+    call_context_var.set(context)
+    return context
+
+
+def log_event(event_type: str, payload: dict):
+    """Log an OpenAI event, honouring per-event levels and sampling.
+
+    The payload is not serialized here; that happens in the writer thread.
+    """
+    level = EVENT_LEVELS.get(event_type, logging.INFO)
+    if not logger.isEnabledFor(level):
+        return
+    rate = EVENT_SAMPLING.get(event_type)
+    if rate is not None and random.random() >= rate:
+        return
+    logger.log(level, "Received event", extra={"event": event_type, "payload": payload})
+
+
+def log(level: int, msg: str, **fields):
+    """Log a message with structured fields attached."""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"fields": fields} if fields else None)
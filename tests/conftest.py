@@ -0,0 +1,42 @@
+"""Shared fixtures: a throwaway SQLite database wired into ``database``."""
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_routes  # noqa: E402
+import database  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path, monkeypatch):
+    """Point ``database.engine`` / ``SessionLocal`` at an empty SQLite file."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'calls.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(
+        database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(sqlite_engine):
+    """Database with the current schema created."""
+    database.init_db()
+    return sqlite_engine
+
+
+@pytest.fixture
+def client(db):
+    """TestClient for the dashboard API routes, without the app lifespan."""
+    app = FastAPI()
+    app.include_router(api_routes.router)
+    with TestClient(app) as client:
+        yield client
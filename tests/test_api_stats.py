@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def finished_call(db):
+    database.create_call("CA_1", "+100")
+    database.finalize_call("CA_1", duration=42)
+
+
+def _today(fmt: str) -> str:
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).strftime(fmt)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"start": _today("%Y-%m-%dT%H:%M:%S")},
+        {"start": _today("%Y-%m-%dT%H:%M:%SZ")},
+        {"start": _today("%Y-%m-%dT%H:%M:%S+00:00")},
+        {"start": _today("%Y-%m-%dT%H:%M:%S"), "end": "2100-01-01T00:00:00"},
+        {"start": _today("%Y-%m-%dT%H:%M:%SZ"), "end": "2100-01-01T00:00:00"},
+        # 02:00+02:00 del día anterior == 00:00Z del día anterior
+        {"start": (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%dT02:00:00+02:00")},
+    ],
+)
+def test_stats_accepts_naive_z_and_offset_datetimes(client, finished_call, params):
+    response = client.get("/api/stats", params=params)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["call_count"] == 1
+    assert response.json()["total_duration"] == 42
+
+
+def test_stats_default_start_is_day_of_end(client, finished_call):
+    response = client.get("/api/stats", params={"end": "2026-01-10T15:30:00"})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["start"].startswith("2026-01-10T00:00:00")
+    assert response.json()["call_count"] == 0
+
+
+def test_stats_default_start_when_end_is_midnight(client, db):
+    response = client.get("/api/stats", params={"end": "2026-01-10T00:00:00Z"})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["start"].startswith("2026-01-09T00:00:00")
+
+
+def test_stats_rejects_start_after_end(client, db):
+    response = client.get(
+        "/api/stats", params={"start": "2026-01-10T00:00:00Z", "end": "2026-01-09T00:00:00+01:00"}
+    )
+
+    assert response.status_code == 400
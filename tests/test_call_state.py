@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+from call_state import CallSnapshot, LiveCall, SQLiteCallStateStore, recover_orphaned_calls
+from models import Call
+
+
+def _snapshot(call_sid, age=0.0, **fields):
+    now = time.time()
+    return CallSnapshot(
+        call_sid=call_sid,
+        stream_sid=f"MZ_{call_sid}",
+        worker_id="worker-1",
+        started_at=now - age - 30,
+        updated_at=now - age,
+        **fields,
+    )
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "call_state.db")
+
+
+@pytest.fixture
+def store(store_path):
+    return SQLiteCallStateStore(store_path)
+
+
+def test_list_and_count_respect_stale_cutoff(store):
+    store.save(_snapshot("CA_fresh", conversation=[{"user": "hola"}]))
+    store.save(_snapshot("CA_stale", age=120))
+
+    assert [s.call_sid for s in store.list_active(stale_after=60)] == ["CA_fresh"]
+    assert store.count_active(stale_after=60) == 1
+    assert store.count_active(stale_after=300) == 2
+    assert store.get("CA_fresh").conversation == [{"user": "hola"}]
+
+    store.delete("CA_fresh")
+    assert store.get("CA_fresh") is None
+
+
+def test_claim_stale_returns_each_orphan_to_exactly_one_store(store_path):
+    stores = [SQLiteCallStateStore(store_path) for _ in range(2)]
+    orphans = {f"CA_{i}" for i in range(200)}
+    for call_sid in orphans:
+        stores[0].save(_snapshot(call_sid, age=120))
+    stores[0].save(_snapshot("CA_live"))
+
+    barrier = threading.Barrier(len(stores))
+    claimed = [[] for _ in stores]
+
+    def claim(index):
+        barrier.wait()
+        # Varias rondas para que las transacciones de ambos stores se intercalen
+        for _ in range(20):
+            claimed[index].extend(s.call_sid for s in stores[index].claim_stale(stale_after=60))
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(len(stores))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_claimed = claimed[0] + claimed[1]
+    assert len(all_claimed) == len(orphans)
+    assert set(all_claimed) == orphans
+    assert [s.call_sid for s in stores[1].list_active(stale_after=60)] == ["CA_live"]
+
+
+def test_checkpoint_after_close_is_a_noop(store):
+    live_call = LiveCall(store, _snapshot("CA_1"))
+    live_call.checkpoint([{"user": "hola"}])
+    assert store.get("CA_1").conversation == [{"user": "hola"}]
+
+    live_call.close()
+    live_call.checkpoint([{"user": "hola"}, {"user": "adiós"}])
+
+    assert store.get("CA_1") is None
+
+
+def test_concurrent_checkpoints_cannot_republish_closed_call(store):
+    live_call = LiveCall(store, _snapshot("CA_1"))
+    stop = threading.Event()
+
+    def checkpoint_loop():
+        while not stop.is_set():
+            live_call.checkpoint([])
+
+    thread = threading.Thread(target=checkpoint_loop)
+    thread.start()
+    time.sleep(0.05)
+    live_call.close()
+    time.sleep(0.05)
+    stop.set()
+    thread.join()
+
+    assert store.get("CA_1") is None
+
+
+def test_recover_orphaned_calls_finalizes_call(db, store):
+    database.create_call("CA_orphan", "+100")
+    conversation = [{"user": "¿cuánto cuesta?", "ai": "Cuesta 30 euros", "timestamp": 1}]
+    snapshot = _snapshot("CA_orphan", age=120, conversation=conversation)
+    store.save(snapshot)
+    store.save(_snapshot("CA_live"))
+
+    assert recover_orphaned_calls(store, stale_after=60) == 1
+
+    session = database.SessionLocal()
+    try:
+        call = session.query(Call).filter(Call.call_sid == "CA_orphan").one()
+        assert call.status == "completed"
+        assert call.interaction_log == conversation
+        assert call.duration == int(snapshot.updated_at - snapshot.started_at)
+    finally:
+        session.close()
+    assert store.get("CA_orphan") is None
+    assert store.get("CA_live") is not None
+    assert recover_orphaned_calls(store, stale_after=60) == 0
+
+
+def test_recover_creates_missing_call_record(db, store):
+    store.save(_snapshot("CA_never_created", age=120, user_phone="+300", session_profile="default@2"))
+
+    assert recover_orphaned_calls(store, stale_after=60) == 1
+
+    session = database.SessionLocal()
+    try:
+        call = session.query(Call).filter(Call.call_sid == "CA_never_created").one()
+        assert (call.status, call.user_phone) == ("completed", "+300")
+        assert (call.session_profile, call.session_profile_version) == ("default", 2)
+    finally:
+        session.close()
+
+
+def test_recover_without_database_keeps_snapshots(store, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", None)
+    store.save(_snapshot("CA_orphan", age=120))
+
+    assert recover_orphaned_calls(store, stale_after=60) == 0
+    assert store.get("CA_orphan") is not None
+
+
+def test_recover_puts_snapshot_back_when_write_fails(store, tmp_path, monkeypatch):
+    # Base de datos inalcanzable: el directorio no existe
+    engine = create_engine(f"sqlite:///{tmp_path / 'missing' / 'calls.db'}")
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    snapshot = _snapshot("CA_orphan", age=120, conversation=[{"user": "hola", "ai": "hola", "timestamp": 1}])
+    store.save(snapshot)
+
+    assert recover_orphaned_calls(store, stale_after=60) == 0
+
+    kept = store.get("CA_orphan")
+    assert kept is not None
+    assert kept.conversation == snapshot.conversation
+    # Sigue huérfano: la siguiente ronda lo vuelve a intentar
+    assert [s.call_sid for s in store.claim_stale(stale_after=60)] == ["CA_orphan"]
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+
+import call_stats
+import database
+from models import Call, CallStatsRollup
+
+OLD_DAY = datetime(2025, 3, 10, tzinfo=timezone.utc)
+
+
+def _add_calls(*calls):
+    db = database.SessionLocal()
+    try:
+        for call_sid, hour, duration, intent in calls:
+            db.add(Call(
+                call_sid=call_sid,
+                user_phone="+100",
+                start_time=OLD_DAY + timedelta(hours=hour),
+                interaction_log=[],
+                status="completed",
+                duration=duration,
+                user_intent=intent,
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _stats(start=OLD_DAY, end=OLD_DAY + timedelta(days=1)):
+    db = database.SessionLocal()
+    try:
+        return call_stats.get_stats(db, start, end)
+    finally:
+        db.close()
+
+
+def _rollup_rows():
+    db = database.SessionLocal()
+    try:
+        return db.query(CallStatsRollup).count()
+    finally:
+        db.close()
+
+
+def test_backfill_rolls_up_history_only_when_empty(db):
+    # Llamadas finalizadas antes de que existieran los rollups
+    _add_calls(("CA_1", 9, 30, "compra"), ("CA_2", 15, 90, None))
+
+    call_stats.backfill_rollups()
+
+    stats = _stats()
+    assert stats["call_count"] == 2
+    assert stats["total_duration"] == 120
+    assert stats["intent_counts"] == {"compra": 1, "unknown": 1}
+    assert _rollup_rows() == 3  # 2 horas + 1 día
+
+    _add_calls(("CA_3", 10, 10, None))
+    call_stats.backfill_rollups()
+    assert _stats()["call_count"] == 2
+
+
+def test_update_and_delete_recompute_old_day(client):
+    _add_calls(("CA_1", 9, 30, None), ("CA_2", 15, 90, None))
+    call_stats.backfill_rollups()
+    call_ids = {call["call_sid"]: call["id"] for call in client.get("/api/calls").json()["calls"]}
+
+    response = client.put(f"/api/calls/{call_ids['CA_1']}", json={"duration": 60, "user_intent": "compra"})
+    assert response.status_code == 200, response.text
+    stats = _stats()
+    assert stats["total_duration"] == 150
+    assert stats["intent_counts"] == {"compra": 1, "unknown": 1}
+
+    response = client.delete(f"/api/calls/{call_ids['CA_2']}")
+    assert response.status_code == 200, response.text
+    stats = _stats()
+    assert (stats["call_count"], stats["total_duration"]) == (1, 60)
+    # Una hora parcial del rango usa rollups horarios: también deben estar al día
+    assert _stats(OLD_DAY + timedelta(hours=12), OLD_DAY + timedelta(hours=18))["call_count"] == 0
+
+
+def test_finalize_call_updates_rollups_incrementally(db):
+    database.create_call("CA_1", "+100")
+    database.finalize_call("CA_1", duration=42)
+
+    now = datetime.now(timezone.utc)
+    stats = _stats(call_stats.bucket_start(now, "day"), now + timedelta(hours=1))
+    assert (stats["call_count"], stats["total_duration"]) == (1, 42)
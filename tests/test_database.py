@@ -0,0 +1,49 @@
+from sqlalchemy import inspect, text
+
+import database
+from models import Call
+
+# Tabla "calls" tal como la creaba la primera versión del modelo
+BASELINE_CALLS_DDL = """
+CREATE TABLE calls (
+    id INTEGER NOT NULL PRIMARY KEY,
+    call_sid VARCHAR NOT NULL UNIQUE,
+    user_phone VARCHAR NOT NULL,
+    start_time DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL,
+    interaction_log JSON NOT NULL,
+    status VARCHAR NOT NULL,
+    duration INTEGER,
+    user_intent VARCHAR
+)
+"""
+
+
+def test_init_db_migrates_existing_calls_table(sqlite_engine):
+    with sqlite_engine.begin() as conn:
+        conn.execute(text(BASELINE_CALLS_DDL))
+        conn.execute(text(
+            "INSERT INTO calls (call_sid, user_phone, interaction_log, status) "
+            "VALUES ('CA_old', '+100', '[]', 'completed')"
+        ))
+
+    database.init_db()
+    database.init_db()  # idempotente
+
+    inspector = inspect(sqlite_engine)
+    columns = {column["name"] for column in inspector.get_columns("calls")}
+    assert {"session_profile", "session_profile_version"} <= columns
+    indexes = {index["name"] for index in inspector.get_indexes("calls")}
+    assert {"ix_calls_start_time", "ix_calls_session_profile"} <= indexes
+
+    assert database.create_call("CA_new", "+200", "default", 3) is not None
+    db = database.SessionLocal()
+    try:
+        calls = {call.call_sid: call for call in db.query(Call)}
+    finally:
+        db.close()
+    assert calls["CA_old"].session_profile is None
+    assert (calls["CA_new"].session_profile, calls["CA_new"].session_profile_version) == ("default", 3)
+
+
+def test_init_db_on_empty_database(db):
+    assert database.create_call("CA_1", "+100") is not None
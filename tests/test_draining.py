@@ -0,0 +1,154 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import call_state
+import draining
+import main
+from draining import DrainController
+
+
+def test_admit_and_release():
+    controller = DrainController(timeout=1, flush_timeout=1)
+
+    assert controller.admit()
+    assert controller.admit()
+    controller.release()
+    assert controller.active_streams == 1
+
+    controller.draining = True
+    assert not controller.admit()
+    assert controller.active_streams == 1
+
+
+async def test_drain_returns_when_calls_finish(monkeypatch):
+    monkeypatch.setattr(draining, "DRAIN_POLL_INTERVAL", 0.01)
+    controller = DrainController(timeout=5, flush_timeout=1)
+    controller.admit()
+
+    asyncio.get_running_loop().call_later(0.05, controller.release)
+    started = time.monotonic()
+    await controller.drain()
+
+    assert controller.active_streams == 0
+    assert not controller.admit()
+    assert time.monotonic() - started < 1
+
+
+async def test_drain_stops_waiting_at_deadline(monkeypatch):
+    monkeypatch.setattr(draining, "DRAIN_POLL_INTERVAL", 0.01)
+    controller = DrainController(timeout=0.1, flush_timeout=1)
+    controller.admit()
+
+    started = time.monotonic()
+    await controller.drain()
+
+    assert controller.active_streams == 1
+    assert 0.1 <= time.monotonic() - started < 1
+
+
+async def test_flush_writes_waits_for_shielded_writes():
+    controller = DrainController(timeout=1, flush_timeout=5)
+    done = []
+
+    def slow_write(value):
+        time.sleep(0.1)
+        done.append(value)
+
+    # Cancelar al llamador no cancela la escritura; flush_writes la espera
+    caller = asyncio.create_task(controller.run_write(slow_write, "call"))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+
+    await controller.flush_writes()
+    assert done == ["call"]
+
+
+async def test_flush_writes_gives_up_after_timeout():
+    controller = DrainController(timeout=1, flush_timeout=0.05)
+    release = threading.Event()
+    writer = asyncio.create_task(controller.run_write(release.wait, 5))
+    await asyncio.sleep(0.01)
+
+    started = time.monotonic()
+    await controller.flush_writes()
+    assert time.monotonic() - started < 1
+
+    release.set()
+    await writer
+
+
+class SilentOpenAI:
+    """Stand-in for the OpenAI Realtime socket: stays open and never sends."""
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+        self.sent = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed.set()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.closed.wait()
+        raise StopAsyncIteration
+
+
+@pytest.fixture
+def relay_client(monkeypatch):
+    controller = DrainController(timeout=1, flush_timeout=1)
+    openai_sockets = []
+
+    def connect(*args, **kwargs):
+        openai_sockets.append(SilentOpenAI())
+        return openai_sockets[-1]
+
+    monkeypatch.setattr(main, "drain", controller)
+    monkeypatch.setattr(main, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(main.websockets, "connect", connect)
+    monkeypatch.setattr(call_state, "store", call_state.InMemoryCallStateStore())
+
+    app = FastAPI()
+    app.include_router(main.router)
+    with TestClient(app) as client:
+        yield client, controller, openai_sockets
+
+
+def test_twilio_hangup_releases_stream_while_openai_is_silent(relay_client):
+    client, controller, openai_sockets = relay_client
+
+    with client.websocket_connect("/media-stream") as websocket:
+        websocket.send_text(json.dumps({
+            "event": "start",
+            "start": {"streamSid": "MZ_1", "callSid": "CA_1", "customParameters": {}},
+        }))
+        deadline = time.monotonic() + 2
+        while controller.active_streams != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert controller.active_streams == 1
+
+        # Twilio cuelga; se espera dentro del bloque porque al salir TestClient cancela la app
+        websocket.close()
+        deadline = time.monotonic() + 2
+        while controller.active_streams and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert controller.active_streams == 0
+    assert openai_sockets[0].closed.is_set()
+    assert call_state.store.get("CA_1") is None
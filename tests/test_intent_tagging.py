@@ -0,0 +1,51 @@
+import json
+import os
+
+import database
+import intent_tagging
+from models import Call
+
+
+def _intents():
+    db = database.SessionLocal()
+    try:
+        return {call.call_sid: call.user_intent for call in db.query(Call)}
+    finally:
+        db.close()
+
+
+def test_classify_transcript():
+    assert intent_tagging.classify_transcript([]) == intent_tagging.NO_INTERACTION
+    assert intent_tagging.classify_transcript([{"user": "¿Cuánto cuesta el envío?"}]) == "compra"
+    assert intent_tagging.classify_transcript([{"ai": "Hola"}, {"user": "No me interesa"}]) == "no_interesado"
+
+
+def test_call_finalized_after_a_run_is_tagged_by_the_next_run(db, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    database.create_call("CA_A", "+100")  # sigue activa durante la primera pasada
+    database.create_call("CA_B", "+200")
+    database.update_call_interaction("CA_B", [{"user": "quiero comprar"}])
+    database.finalize_call("CA_B", duration=10)
+
+    assert intent_tagging.run_backfill(workers=1, checkpoint_path=checkpoint) == 1
+
+    database.update_call_interaction("CA_A", [{"user": "qué dosis tomo al día"}])
+    database.finalize_call("CA_A", duration=20)
+
+    assert intent_tagging.run_backfill(workers=1, checkpoint_path=checkpoint) == 1
+    assert _intents() == {"CA_A": "dosis_uso", "CA_B": "compra"}
+
+
+def test_interrupted_run_resumes_from_checkpoint(db, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    for i in range(3):
+        database.create_call(f"CA_{i}", "+100")
+        database.finalize_call(f"CA_{i}", duration=5)
+
+    assert intent_tagging.run_backfill(batch_size=1, workers=1, checkpoint_path=checkpoint, limit=1) == 1
+    with open(checkpoint, encoding="utf-8") as file:
+        assert json.load(file)["processed"] == 1
+
+    assert intent_tagging.run_backfill(batch_size=1, workers=1, checkpoint_path=checkpoint) == 2
+    assert not os.path.exists(checkpoint)
+    assert set(_intents().values()) == {intent_tagging.NO_INTERACTION}
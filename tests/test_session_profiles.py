@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+from session_profiles import ProfileRegistry
+
+PROFILES_YAML = """
+default_profile: default
+profiles:
+  default:
+    version: {version}
+    voice: shimmer
+    instructions: "{instructions}"
+    temperature: 0.8
+    turn_detection:
+      type: server_vad
+"""
+
+
+@pytest.fixture
+def write_profiles(tmp_path):
+    path = tmp_path / "session_profiles.yaml"
+
+    def write(version, instructions):
+        path.write_text(PROFILES_YAML.format(version=version, instructions=instructions))
+        # Forzar un mtime distinto aunque la escritura caiga en el mismo tick
+        mtime = os.stat(path).st_mtime + version + len(instructions)
+        os.utime(path, (mtime, mtime))
+        return str(path)
+
+    return write
+
+
+def test_load_builds_pre_serialized_payload(write_profiles):
+    registry = ProfileRegistry(write_profiles(1, "Hola"))
+    registry.load()
+
+    profile = registry.get()
+    assert profile.label == "default@1"
+    assert json.loads(profile.payload)["session"]["instructions"] == "Hola"
+
+
+def test_reload_applies_change_with_new_version(write_profiles):
+    registry = ProfileRegistry(write_profiles(1, "Hola"))
+    registry.load()
+
+    write_profiles(2, "Buenos días")
+    assert registry.reload_if_changed()
+    assert registry.get().label == "default@2"
+    assert registry.get().instructions == "Buenos días"
+
+
+def test_reload_rejects_changed_payload_with_same_version(write_profiles):
+    registry = ProfileRegistry(write_profiles(1, "Hola"))
+    registry.load()
+
+    write_profiles(1, "Buenos días")
+    assert not registry.reload_if_changed()
+    assert registry.get().instructions == "Hola"
+    # El rechazo no se repite en cada sondeo mientras el archivo no cambie
+    assert not registry.reload_if_changed()
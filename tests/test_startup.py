@@ -0,0 +1,24 @@
+"""Cold start budget, measured with the same probe as ``bench_startup.py``."""
+import os
+import statistics
+
+import bench_startup
+
+# Presupuesto generoso para no fallar en máquinas de CI lentas; ajustable por entorno
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 1500))
+RUNS = 3
+
+
+def test_cold_start_within_budget():
+    # Sin base de datos: se mide el arranque del worker, no la conexión a PostgreSQL
+    samples = [bench_startup.run_once({"DATABASE_URL": ""}) for _ in range(RUNS)]
+
+    first_response_ms = statistics.median(s["first_response_ms"] for s in samples)
+    assert first_response_ms <= STARTUP_BUDGET_MS, (
+        f"first / response took {first_response_ms:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)"
+    )
+
+
+def test_twilio_rest_not_imported_at_startup():
+    # twilio.rest solo hace falta para llamadas salientes y cuesta ~55 ms de import
+    assert not bench_startup.run_once({"DATABASE_URL": ""})["twilio_rest_loaded"]
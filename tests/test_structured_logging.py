@@ -0,0 +1,99 @@
+import asyncio
+import io
+import json
+import logging
+
+import pytest
+
+import structured_logging
+from structured_logging import JsonFormatter
+
+
+@pytest.fixture
+def log_output(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    stream = io.StringIO()
+    structured_logging.configure_logging(stream=stream)
+
+    def lines():
+        # Parar el listener vacía la cola y escribe todo lo pendiente
+        structured_logging.shutdown_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield lines
+    structured_logging.shutdown_logging()
+
+
+def test_event_levels(log_output, monkeypatch):
+    monkeypatch.setitem(structured_logging.EVENT_LEVELS, "response.done", logging.DEBUG)
+
+    structured_logging.log_event("response.done", {"type": "response.done"})
+    structured_logging.log_event("session.created", {"type": "session.created"})
+
+    assert [line["event"] for line in log_output()] == ["session.created"]
+
+
+def test_event_sampling(log_output, monkeypatch):
+    monkeypatch.setitem(structured_logging.EVENT_SAMPLING, "rate_limits.updated", 0.0)
+    monkeypatch.setitem(structured_logging.EVENT_SAMPLING, "session.updated", 1.0)
+
+    for _ in range(20):
+        structured_logging.log_event("rate_limits.updated", {})
+        structured_logging.log_event("session.updated", {})
+
+    events = [line["event"] for line in log_output()]
+    assert events == ["session.updated"] * 20
+
+
+def test_large_payloads_are_clipped_before_serializing():
+    formatter = JsonFormatter(max_payload_chars=100)
+    payload = {
+        "type": "response.done",
+        "response": {"output": [{"transcript": "a" * 10_000} for _ in range(1000)]},
+    }
+    record = logging.LogRecord("relay", logging.INFO, __file__, 1, "Received event", None, None)
+    record.payload = payload
+    record.fields = {"transcript": "b" * 10_000}
+
+    line = formatter.format(record)
+
+    assert len(line) < 1000
+    entry = json.loads(line)
+    assert entry["payload"]["type"] == "response.done"
+    output = entry["payload"]["response"]["output"]
+    assert output[0]["transcript"].startswith("a" * 50)
+    assert output[-1].startswith("…(+")
+    assert entry["transcript"].endswith("…(+9900 chars)")
+
+
+def test_small_payloads_are_kept_intact():
+    formatter = JsonFormatter(max_payload_chars=100)
+    payload = {"type": "session.created", "session": {"id": "sess_1", "voice": "shimmer"}}
+    record = logging.LogRecord("relay", logging.INFO, __file__, 1, "Received event", None, None)
+    record.payload = payload
+
+    assert json.loads(formatter.format(record))["payload"] == payload
+
+
+async def test_call_ids_propagate_to_child_tasks(log_output):
+    async def handle_call():
+        context = structured_logging.bind_call()
+
+        async def receive():
+            await asyncio.sleep(0.01)
+            structured_logging.log(logging.INFO, "from receive")
+
+        async def start_event():
+            # Los SIDs llegan después de crear las tareas hijas
+            context.update(call_sid="CA_1", stream_sid="MZ_1")
+
+        await asyncio.gather(receive(), start_event())
+
+    async def other_call():
+        structured_logging.bind_call(call_sid="CA_2", stream_sid="MZ_2")
+        structured_logging.log(logging.INFO, "from other call")
+
+    await asyncio.gather(handle_call(), other_call())
+
+    ids = {line["msg"]: (line["call_sid"], line["stream_sid"]) for line in log_output()}
+    assert ids == {"from receive": ("CA_1", "MZ_1"), "from other call": ("CA_2", "MZ_2")}